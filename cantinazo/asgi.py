@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+El stream de eventos del personal (SSE) sólo se abre bajo ASGI, p. ej.:
+
+    uvicorn cantinazo.asgi:application --workers 4
+
+Con varios workers, EVENTS_BROKER debe ser RedisBroker.
 """
 
 import os
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "order_management.middleware.PerformanceMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -69,6 +70,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "order_management.context_processors.exchange_rate",
             ],
         },
     },
@@ -81,11 +83,57 @@ WSGI_APPLICATION = "cantinazo.wsgi.application"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": env.db_url(
+        "DATABASE_URL", default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"
+    )
 }
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = env.bool(
+    "CONN_HEALTH_CHECKS", default=True
+)
+DATABASES["default"]["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=0)
+
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql" and env.bool(
+    "DATABASE_POOL", default=False
+):
+    # Pool de psycopg (requiere psycopg[pool]); no es compatible con CONN_MAX_AGE.
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": env.int("DATABASE_POOL_MIN_SIZE", default=2),
+        "max_size": env.int("DATABASE_POOL_MAX_SIZE", default=10),
+        "timeout": env.int("DATABASE_POOL_TIMEOUT", default=10),
+    }
+
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3" and env.bool(
+    "SQLITE_TUNED", default=True
+):
+    # WAL permite leer mientras se escribe y las transacciones IMMEDIATE toman el
+    # bloqueo de escritura al empezar, así que esperan en lugar de fallar con
+    # "database is locked".
+    DATABASES["default"].setdefault("OPTIONS", {}).update(
+        {
+            "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+            "transaction_mode": "IMMEDIATE",
+            "timeout": env.int("SQLITE_BUSY_TIMEOUT", default=20),
+        }
+    )
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Las versiones de caché (tasa de cambio, catálogo, preparación) deben verse en
+# todos los procesos: con varios workers úsese un backend compartido, p. ej.
+# CACHE_URL=rediscache://localhost:6379/1 o dbcache://cache_table (requiere
+# "manage.py createcachetable").
+CACHES = {"default": env.cache_url("CACHE_URL", default="locmemcache://")}
+
+# Con LocMemCache cada proceso tiene su propia copia de las versiones, así que
+# caducan pronto para que un cambio hecho en otro worker se vea en segundos.
+# 0 = sin caducidad.
+LOCAL_CACHE = CACHES["default"]["BACKEND"].endswith("LocMemCache")
+CACHE_VERSION_TIMEOUT = (
+    env.int("CACHE_VERSION_TIMEOUT", default=30 if LOCAL_CACHE else 0) or None
+)
 
 
 # Password validation
@@ -144,3 +192,20 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 TWILIO_ACCOUNT_SID = env("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = env("TWILIO_AUTH_TOKEN")
 TWILIO_WHATSAPP_NUMBER = env("TWILIO_WHATSAPP_NUMBER")
+TWILIO_FAKE = env.bool("TWILIO_FAKE", default=False)
+
+ORDER_NOTIFICATION_RECIPIENTS = env.list(
+    "ORDER_NOTIFICATION_RECIPIENTS",
+    default=["+584123517748", "+584248377782", "+584121665210"],
+)
+NOTIFICATION_MAX_ATTEMPTS = env.int("NOTIFICATION_MAX_ATTEMPTS", default=5)
+NOTIFICATION_RETRY_DELAY = env.int("NOTIFICATION_RETRY_DELAY", default=30)
+
+EVENTS_BROKER = env(
+    "EVENTS_BROKER", default="order_management.events.LocalBroker"
+)
+EVENTS_REDIS_URL = env("EVENTS_REDIS_URL", default="redis://localhost:6379/0")
+
+PERFORMANCE_SAMPLE_RATE = env.float("PERFORMANCE_SAMPLE_RATE", default=0.1)
+PERFORMANCE_RING_SIZE = env.int("PERFORMANCE_RING_SIZE", default=200)
+PERFORMANCE_SLOW_QUERIES = env.int("PERFORMANCE_SLOW_QUERIES", default=5)
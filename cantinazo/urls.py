@@ -18,6 +18,21 @@ urlpatterns = [
         login_required(views.StaffEventView.as_view()),
         name="staff-event",
     ),
+    path(
+        "staff/event/<int:event>/stream/",
+        login_required(views.staff_event_stream),
+        name="staff-event-stream",
+    ),
+    path(
+        "staff/event/<int:event>/preparation/",
+        login_required(views.StaffPreparationView.as_view()),
+        name="staff-preparation",
+    ),
+    path(
+        "staff/performance/",
+        login_required(views.staff_performance),
+        name="staff-performance",
+    ),
     path("staff/login/", LoginView.as_view(), name="login"),
     path("staff/logout/", LogoutView.as_view(), name="logout"),
     path("", views.WelcomeView.as_view(), name="welcome"),
@@ -27,6 +42,7 @@ urlpatterns = [
         views.RepresentativeCreateView.as_view(),
         name="representative-create",
     ),
+    path("cart/", views.CartView.as_view(), name="cart"),
     path("student/list/", views.StudentListView.as_view(), name="student-list"),
     path("student/create/", views.StudentCreateView.as_view(), name="student-create"),
     path("student/delete/<int:pk>", views.student_remove, name="student-delete"),
@@ -41,6 +57,11 @@ urlpatterns = [
         login_required(views.StaffOderList.as_view()),
         name="staff-order-list",
     ),
+    path(
+        "staff/order/<int:pk>/",
+        login_required(views.StaffOrderDetailView.as_view()),
+        name="staff-order-detail",
+    ),
     path(
         "staff/product/list/<int:event>/",
         login_required(views.StaffProductListView.as_view()),
@@ -67,6 +88,11 @@ urlpatterns = [
         views.OrderLineCreateView.as_view(),
         name="orderline-create",
     ),
+    path(
+        "orderline/bulk-create/",
+        views.orderline_bulk_create,
+        name="orderline-bulk-create",
+    ),
     path("orderline/delete/", views.orderline_delete, name="orderline-delete"),
     path("order/close/<int:pk>/", views.order_close, name="order-close"),
     path(
@@ -74,6 +100,17 @@ urlpatterns = [
         views.order_update_status,
         name="order-update-status",
     ),
+    path(
+        "order/update/status/",
+        views.order_bulk_update_status,
+        name="order-bulk-update-status",
+    ),
+    path("staff/roster/import/", views.roster_import, name="roster-import"),
+    path(
+        "staff/event/<int:event>/reconcile/",
+        views.order_reconcile,
+        name="order-reconcile",
+    ),
     path("order/export/", views.export_orders, name="export-orders"),
     path("product/export/", views.export_products, name="export-products"),
 ]
@@ -7,6 +7,9 @@ from .models import (
     Representative,
     Product,
     Event,
+    EventProductStats,
+    Notification,
+    OrderStatusChange,
 )
 
 
@@ -42,3 +45,20 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ["to_number", "created_at", "sent_at", "attempts"]
+
+
+@admin.register(OrderStatusChange)
+class OrderStatusChangeAdmin(admin.ModelAdmin):
+    list_display = ["order", "status", "user", "created_at"]
+    list_filter = ["status"]
+
+
+@admin.register(EventProductStats)
+class EventProductStatsAdmin(admin.ModelAdmin):
+    list_display = ["product", "grade", "sold", "revenue", "revenue_bs"]
+    list_filter = ["event", "grade"]
@@ -0,0 +1,6 @@
+from django.utils.functional import SimpleLazyObject
+from .models import ExchangeRate
+
+
+def exchange_rate(request):
+    return {"exchange_rate": SimpleLazyObject(ExchangeRate.current)}
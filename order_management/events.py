@@ -0,0 +1,95 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class LocalBroker:
+    """Pub/sub en memoria, válido cuando hay un solo proceso ASGI."""
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, name, data):
+        with self._lock:
+            subscribers = list(self._subscribers[channel])
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._offer, queue, (name, data))
+
+    @staticmethod
+    def _offer(queue, message):
+        # Un cliente lento pierde eventos en lugar de acumularlos sin límite.
+        if not queue.full():
+            queue.put_nowait(message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(self.max_pending))
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscriber)
+
+
+class RedisBroker:
+    """Pub/sub sobre Redis para despliegues con varios workers."""
+
+    def __init__(self, url=None, max_pending=100):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImproperlyConfigured("RedisBroker requiere el paquete redis") from e
+        self.url = url or settings.EVENTS_REDIS_URL
+        self.max_pending = max_pending
+        self._client = redis.Redis.from_url(self.url)
+
+    def publish(self, channel, name, data):
+        self._client.publish(channel, json.dumps([name, data]))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        from redis import asyncio as aioredis
+
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel)
+        queue = asyncio.Queue(self.max_pending)
+
+        async def read():
+            async for message in pubsub.listen():
+                if message["type"] == "message" and not queue.full():
+                    queue.put_nowait(tuple(json.loads(message["data"])))
+
+        reader = asyncio.create_task(read())
+        try:
+            yield queue
+        finally:
+            reader.cancel()
+            await pubsub.unsubscribe(channel)
+            await client.aclose()
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.EVENTS_BROKER)()
+
+
+def event_channel(event_id):
+    return f"event:{event_id}"
+
+
+def publish_event(event_id, name, **data):
+    transaction.on_commit(
+        lambda: get_broker().publish(event_channel(event_id), name, data)
+    )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from order_management.models import ExchangeRate, Order, OrderLine, Product, order_total
+
+
+class Command(BaseCommand):
+    help = "Guarda el precio unitario de las líneas y el monto en Bs. de las órdenes cerradas."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            lines = OrderLine.objects.filter(unit_price__isnull=True).update(
+                unit_price=Subquery(
+                    Product.objects.filter(pk=OuterRef("product_id")).values("price")
+                )
+            )
+            orders = Order.objects.filter(
+                closed=True, amount_bs__isnull=True, exchange_rate__isnull=False
+            ).update(
+                amount_bs=order_total()
+                * Subquery(
+                    ExchangeRate.objects.filter(pk=OuterRef("exchange_rate_id")).values(
+                        "rate"
+                    )
+                )
+            )
+
+        self.stdout.write(f"{lines} líneas y {orders} órdenes actualizadas")
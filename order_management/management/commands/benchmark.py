@@ -0,0 +1,393 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from order_management.middleware import QueryRecorder
+from order_management.models import (
+    Event,
+    ExchangeRate,
+    Order,
+    OrderLine,
+    Product,
+    Representative,
+    Student,
+)
+
+# Teléfonos 0400-XXXXXXX: no existen, así que no chocan con representantes reales.
+PHONE_PREFIX = "400"
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * percent / 100))], 2)
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(Counter)
+
+    def request(self, client, name, method, url, data=None, ok=(200, 204, 302)):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = getattr(client, method)(url, data)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            error = None
+            if response.status_code not in ok:
+                error = f"HTTP {response.status_code}"
+        except Exception as e:
+            response, error = None, f"{type(e).__name__}: {e}"
+        duration = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.latencies[name].append(duration)
+            self.queries[name].append(len(recorder.queries))
+            if error:
+                self.errors[name][error] += 1
+        return response
+
+    def summary(self, elapsed):
+        def stats(latencies, queries, errors):
+            return {
+                "requests": len(latencies),
+                "errors": sum(errors.values()),
+                "error_types": dict(errors),
+                "p50_ms": percentile(latencies, 50),
+                "p95_ms": percentile(latencies, 95),
+                "p99_ms": percentile(latencies, 99),
+                "mean_ms": round(sum(latencies) / len(latencies), 2),
+                "queries_per_request": round(sum(queries) / len(queries), 2),
+            }
+
+        latencies = [ms for values in self.latencies.values() for ms in values]
+        queries = [count for values in self.queries.values() for count in values]
+        total = stats(latencies, queries, sum(self.errors.values(), Counter()))
+        total["elapsed_s"] = round(elapsed, 2)
+        total["throughput_rps"] = round(len(latencies) / elapsed, 2)
+        return {
+            "total": total,
+            "endpoints": {
+                name: stats(self.latencies[name], self.queries[name], self.errors[name])
+                for name in sorted(self.latencies)
+            },
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        "Simula representantes y personal concurrentes sobre un evento de prueba "
+        "y reporta latencias, rendimiento y consultas por petición en JSON. "
+        "Escribe en la base de datos configurada: úsese una copia."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--representatives", type=int, default=2000)
+        parser.add_argument(
+            "--students", type=int, default=2, help="Por representante."
+        )
+        parser.add_argument("--products", type=int, default=30)
+        parser.add_argument("--orders", type=int, default=1000, help="Pedidos previos.")
+        parser.add_argument(
+            "--parents", type=int, default=200, help="Flujos simulados."
+        )
+        parser.add_argument("--lines", type=int, default=3, help="Líneas por pedido.")
+        parser.add_argument(
+            "--staff", type=int, default=2, help="Clientes del personal."
+        )
+        parser.add_argument("--staff-iterations", type=int, default=20)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="Archivo JSON de salida.")
+        parser.add_argument(
+            "--keep", action="store_true", help="No borra los datos de prueba."
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options["seed"])
+        self.recorder = Recorder()
+
+        # Los errores se cuentan en el reporte en lugar de imprimir cada traza.
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+
+        # Sin destinatarios no se encolan mensajes de WhatsApp reales.
+        with override_settings(ORDER_NOTIFICATION_RECIPIENTS=[]):
+            self.seed()
+            try:
+                start = time.perf_counter()
+                with ThreadPoolExecutor(options["concurrency"]) as executor:
+                    jobs = [
+                        executor.submit(self.parent_flow, i)
+                        for i in range(options["parents"])
+                    ] + [
+                        executor.submit(self.staff_flow)
+                        for _ in range(options["staff"])
+                    ]
+                    for job in jobs:
+                        job.result()
+                elapsed = time.perf_counter() - start
+            finally:
+                if not options["keep"]:
+                    self.cleanup()
+
+        report = {
+            "config": {
+                key: options[key]
+                for key in [
+                    "representatives",
+                    "students",
+                    "products",
+                    "orders",
+                    "parents",
+                    "lines",
+                    "staff",
+                    "staff_iterations",
+                    "concurrency",
+                    "seed",
+                ]
+            },
+            "database": {
+                "vendor": connection.vendor,
+                "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+                "options": connection.settings_dict["OPTIONS"],
+            },
+            **self.recorder.summary(elapsed),
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+        self.stdout.write(output)
+
+    def phone_number(self, i):
+        return f"{PHONE_PREFIX}{i:07d}"
+
+    @transaction.atomic
+    def seed(self):
+        options = self.options
+        grades = [grade for grade, _ in Student.GRADE_CHOICES]
+        sections = [section for section, _ in Student.SECTION_CHOICES]
+
+        self.event = Event.objects.create(
+            name=f"Benchmark {options['seed']}", scheduled_for=date.today()
+        )
+        self.exchange_rate = ExchangeRate.current()
+        self.created_rate = self.exchange_rate is None
+        if self.created_rate:
+            self.exchange_rate = ExchangeRate.objects.create(rate=40)
+        self.products = Product.objects.bulk_create(
+            Product(
+                name=f"Producto {i}",
+                price=self.random.choice([0.5, 1, 1.5, 2, 2.5, 3]),
+                event=self.event,
+                stock=1_000_000,
+            )
+            for i in range(options["products"])
+        )
+        representatives = Representative.objects.bulk_create(
+            Representative(
+                id=int(f"58{self.phone_number(i)}"),
+                first_name=f"Representante {i}",
+                phone_code="58",
+                phone_number=self.phone_number(i),
+            )
+            for i in range(options["representatives"])
+        )
+        students = Student.objects.bulk_create(
+            Student(
+                name=f"Estudiante {i}-{j}",
+                grade=self.random.choice(grades),
+                section=self.random.choice(sections),
+                representative=representative,
+            )
+            for i, representative in enumerate(representatives)
+            for j in range(options["students"])
+        )
+
+        orders = Order.objects.bulk_create(
+            Order(
+                representative=representatives[i],
+                event=self.event,
+                payment_method=self.random.choice([0, 1]),
+                reference_number=self.random.randint(100000, 999999),
+                exchange_rate=self.exchange_rate,
+                closed=True,
+            )
+            for i in range(min(options["orders"], len(representatives)))
+        )
+        OrderLine.objects.bulk_create(
+            OrderLine(
+                order=order,
+                student=students[i * options["students"]],
+                product=self.random.choice(self.products),
+                quantity=self.random.randint(1, 3),
+            )
+            for i, order in enumerate(orders)
+            for _ in range(options["lines"])
+        )
+        orders = list(Order.objects.filter(event=self.event).with_total())
+        for order in orders:
+            order.amount_bs = (order.total or 0) * self.exchange_rate.rate
+        Order.objects.bulk_update(orders, ["amount_bs"], batch_size=500)
+
+        self.staff_user = get_user_model().objects.create_user(
+            f"benchmark-{options['seed']}-{time.time_ns()}", is_staff=True
+        )
+
+    def parent_flow(self, i):
+        options = self.options
+        client = Client()
+        request = self.recorder.request
+        event = self.event.pk
+
+        # La mitad de los flujos son representantes precargados que vuelven.
+        returning = i % 2 == 0 and i < options["representatives"]
+        number = i if returning else options["representatives"] + i
+        phone_number = self.phone_number(number)
+        representative = int(f"58{phone_number}")
+        request(
+            client,
+            "representative-create",
+            "post",
+            reverse("representative-create"),
+            {
+                "event": event,
+                "phone_code": "58",
+                "phone_number": phone_number,
+                "first_name": "" if returning else f"Nuevo {i}",
+            },
+        )
+        if not returning:
+            request(
+                client,
+                "student-create",
+                "post",
+                reverse("student-create"),
+                {
+                    "representative": representative,
+                    "name": f"Nuevo estudiante {i}",
+                    "grade": Student.GRADE_CHOICES[i % 11][0],
+                    "section": "A",
+                },
+            )
+        request(
+            client,
+            "cart",
+            "get",
+            reverse("cart"),
+            {"representative": representative, "event": event},
+        )
+
+        order = Order.objects.filter(
+            representative_id=representative, event_id=event, closed=False
+        ).first()
+        student = Student.objects.filter(representative_id=representative).first()
+        if order is None or student is None:
+            return
+        for _ in range(options["lines"]):
+            request(
+                client,
+                "orderline-bulk-create",
+                "post",
+                reverse("orderline-bulk-create"),
+                {
+                    "order": order.pk,
+                    "student": student.pk,
+                    "product": self.random.choice(self.products).pk,
+                    "quantity": self.random.randint(1, 3),
+                },
+            )
+        request(
+            client,
+            "order-close",
+            "post",
+            reverse("order-close", args=[order.pk]),
+            {
+                "payment_method": 0,
+                "reference_number": 100000 + i,
+                "exchange_rate": self.exchange_rate.pk,
+            },
+        )
+        connections.close_all()
+
+    def staff_flow(self):
+        client = Client()
+        client.force_login(self.staff_user)
+        request = self.recorder.request
+        event = self.event.pk
+        orders = list(
+            Order.objects.filter(event=self.event, closed=True).values_list(
+                "pk", flat=True
+            )
+        )
+        for _ in range(self.options["staff_iterations"]):
+            request(
+                client,
+                "staff-order-list",
+                "get",
+                reverse("staff-order-list"),
+                {"event": event},
+            )
+            request(
+                client,
+                "staff-order-list",
+                "get",
+                reverse("staff-order-list"),
+                {"event": event, "before": self.random.choice(orders)},
+            )
+            request(
+                client,
+                "order-bulk-update-status",
+                "post",
+                reverse("order-bulk-update-status"),
+                {
+                    "order": self.random.sample(orders, min(10, len(orders))),
+                    "status": self.random.choice([0, 1, 2]),
+                },
+            )
+            request(
+                client,
+                "staff-preparation",
+                "get",
+                reverse("staff-preparation", args=[event]),
+            )
+            request(
+                client,
+                "staff-product-list",
+                "get",
+                reverse("staff-product-list", args=[event]),
+            )
+            request(
+                client,
+                "export-orders",
+                "get",
+                reverse("export-orders"),
+                {"event": event, "format": "csv"},
+            )
+        connections.close_all()
+
+    def cleanup(self):
+        with transaction.atomic():
+            OrderLine.objects.filter(order__event=self.event).delete()
+            self.event.delete()
+            Representative.objects.filter(
+                phone_code="58", phone_number__startswith=PHONE_PREFIX
+            ).delete()
+            self.staff_user.delete()
+            if self.created_rate:
+                self.exchange_rate.delete()
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import Count, Min, Sum
+from order_management.models import OrderLine
+
+
+class Command(BaseCommand):
+    help = "Une las líneas repetidas de una orden en una sola línea con cantidad."
+
+    def handle(self, *args, **options):
+        duplicates = list(
+            OrderLine.objects.values(
+                "order_id", "student_id", "product_id", "unit_price"
+            )
+            .annotate(keep=Min("pk"), quantity=Sum("quantity"), lines=Count("pk"))
+            .filter(lines__gt=1)
+            .order_by()
+        )
+
+        with transaction.atomic():
+            for duplicate in duplicates:
+                OrderLine.objects.filter(pk=duplicate["keep"]).update(
+                    quantity=duplicate["quantity"]
+                )
+                # QuerySet.delete base: las unidades siguen vendidas, así que
+                # no se devuelve stock.
+                models.QuerySet.delete(
+                    OrderLine.objects.filter(
+                        order_id=duplicate["order_id"],
+                        student_id=duplicate["student_id"],
+                        product_id=duplicate["product_id"],
+                        unit_price=duplicate["unit_price"],
+                    ).exclude(pk=duplicate["keep"])
+                )
+
+        self.stdout.write(
+            f"{sum(d["lines"] - 1 for d in duplicates)} líneas unidas en "
+            f"{len(duplicates)}"
+        )
@@ -0,0 +1,74 @@
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from order_management.models import (
+    Event,
+    ExchangeRate,
+    Order,
+    OrderLine,
+    Product,
+    Representative,
+    Student,
+)
+
+# SQLite: "SCAN tabla" sin índice; PostgreSQL: "Seq Scan on tabla".
+FULL_SCAN = re.compile(
+    r"(?:^|\s)SCAN (\w+)\b(?! USING)|Seq Scan on (\w+)", re.MULTILINE
+)
+
+
+def full_scans(plan):
+    return [a or b for a, b in FULL_SCAN.findall(plan)]
+
+
+def hot_queries(event, representative):
+    return {
+        "carrito abierto": Order.objects.filter(
+            representative_id=representative, event_id=event, closed=False
+        ),
+        "pedidos del evento": Order.objects.filter(
+            event_id=event, closed=True
+        ).order_by("-pk"),
+        "exportar pedidos": OrderLine.objects.filter(
+            order__event_id=event, order__closed=True
+        ).exclude(order__rejected=True),
+        "productos del evento": Product.objects.filter(event_id=event, hidden=False),
+        "estudiantes del representante": Student.objects.filter(
+            representative_id=representative
+        ),
+        "estudiantes por grado": Student.objects.filter(
+            grade=Student.GRADE_CHOICES[0][0]
+        ),
+        "tasa de cambio": ExchangeRate.objects.order_by("-created_at")[:1],
+    }
+
+
+class Command(BaseCommand):
+    help = "Muestra el plan de ejecución de las consultas más frecuentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--event", type=int, help="Por defecto, el último.")
+        parser.add_argument(
+            "--representative", type=int, help="Por defecto, el último."
+        )
+
+    def handle(self, *args, **options):
+        event = options["event"] or Event.objects.values_list("pk", flat=True).last()
+        representative = (
+            options["representative"]
+            or Representative.objects.values_list("pk", flat=True).last()
+        )
+        if event is None or representative is None:
+            raise CommandError("No hay eventos o representantes que consultar.")
+
+        for name, queryset in hot_queries(event, representative).items():
+            plan = queryset.explain()
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            tables = full_scans(plan)
+            if tables:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Recorre sin índice en {connection.vendor}: {', '.join(tables)}"
+                    )
+                )
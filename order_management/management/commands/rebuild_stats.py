@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from order_management.models import EventProductStats, OrderLine, product_stats
+
+
+class Command(BaseCommand):
+    help = "Recalcula las estadísticas de ventas por producto a partir de las líneas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--event", type=int, help="Solo este evento.")
+
+    def handle(self, *args, **options):
+        stats = EventProductStats.objects.all()
+        lines = OrderLine.objects.all()
+        if options["event"]:
+            stats = stats.filter(event_id=options["event"])
+            lines = lines.filter(product__event_id=options["event"])
+
+        with transaction.atomic():
+            stats.delete()
+            created = EventProductStats.objects.bulk_create(
+                EventProductStats(
+                    event_id=event_id,
+                    product_id=product_id,
+                    grade=grade,
+                    sold=sold,
+                    revenue=revenue,
+                    revenue_bs=revenue_bs,
+                )
+                for (event_id, product_id, grade), (
+                    sold,
+                    revenue,
+                    revenue_bs,
+                ) in product_stats(lines).items()
+            )
+
+        self.stdout.write(f"{len(created)} estadísticas recalculadas")
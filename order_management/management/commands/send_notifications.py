@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from order_management.utils import send_pending_notifications
+
+
+class Command(BaseCommand):
+    help = "Envía por WhatsApp las notificaciones pendientes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Sigue enviando cada --interval segundos.",
+        )
+        parser.add_argument("--interval", type=float, default=5)
+
+    def handle(self, *args, **options):
+        while True:
+            sent = send_pending_notifications()
+            if sent:
+                self.stdout.write(f"{sent} notificaciones enviadas")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
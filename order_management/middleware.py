@@ -0,0 +1,176 @@
+import bisect
+import random
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+# Límites superiores (ms) de los intervalos del histograma de latencia.
+LATENCY_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf")]
+
+
+class PerformanceStats:
+    """
+    Métricas por vista acotadas en memoria: histograma de latencia, consultas,
+    consultas duplicadas, las SQL más lentas y un buffer circular de las
+    últimas peticiones muestreadas. Son por proceso.
+    """
+
+    def __init__(self, ring_size=200, slow_queries=5):
+        self.slow_queries = slow_queries
+        self._lock = threading.Lock()
+        self._views = defaultdict(self._empty)
+        self._recent = deque(maxlen=ring_size)
+
+    @staticmethod
+    def _empty():
+        return {
+            "requests": 0,
+            "sampled": 0,
+            "histogram": [0] * len(LATENCY_BUCKETS),
+            "total_ms": 0.0,
+            "queries": 0,
+            "duplicates": 0,
+            "slowest_sql": [],
+        }
+
+    def record(self, view, path, duration, queries=None):
+        with self._lock:
+            stats = self._views[view]
+            stats["requests"] += 1
+            stats["total_ms"] += duration
+            stats["histogram"][bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+            if queries is None:
+                return
+
+            repeated = Counter(sql for sql, _ in queries)
+            duplicates = sum(count - 1 for count in repeated.values())
+            stats["sampled"] += 1
+            stats["queries"] += len(queries)
+            stats["duplicates"] += duplicates
+            stats["slowest_sql"] = sorted(
+                stats["slowest_sql"] + sorted(queries, key=lambda q: -q[1])[:1],
+                key=lambda q: -q[1],
+            )[: self.slow_queries]
+            self._recent.append(
+                {
+                    "view": view,
+                    "path": path,
+                    "ms": round(duration, 2),
+                    "queries": len(queries),
+                    "duplicates": duplicates,
+                    "most_repeated": (
+                        repeated.most_common(1)[0][0] if duplicates else None
+                    ),
+                }
+            )
+
+    def snapshot(self):
+        with self._lock:
+            views = {}
+            for view, stats in self._views.items():
+                sampled = stats["sampled"] or 1
+                views[view] = {
+                    "requests": stats["requests"],
+                    "sampled": stats["sampled"],
+                    "avg_ms": round(stats["total_ms"] / stats["requests"], 2),
+                    "histogram": dict(
+                        zip(
+                            [f"<={bucket}" for bucket in LATENCY_BUCKETS[:-1]]
+                            + ["inf"],
+                            stats["histogram"],
+                        )
+                    ),
+                    "avg_queries": round(stats["queries"] / sampled, 2),
+                    "avg_duplicates": round(stats["duplicates"] / sampled, 2),
+                    "slowest_sql": [
+                        {"sql": sql, "ms": round(ms, 2)}
+                        for sql, ms in stats["slowest_sql"]
+                    ],
+                }
+            return {"views": views, "recent": list(self._recent)}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._recent.clear()
+
+
+performance_stats = PerformanceStats(
+    getattr(settings, "PERFORMANCE_RING_SIZE", 200),
+    getattr(settings, "PERFORMANCE_SLOW_QUERIES", 5),
+)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - start) * 1000))
+
+
+class PerformanceMiddleware:
+    """
+    Mide la latencia de cada vista y, en una muestra de las peticiones
+    (PERFORMANCE_SAMPLE_RATE), sus consultas SQL. Añade la cabecera
+    Server-Timing a la respuesta. Funciona en WSGI y en ASGI sin obligar a
+    Django a adaptar el resto de la cadena.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "PERFORMANCE_SAMPLE_RATE", 0.1)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = self._recorder()
+        start = time.perf_counter()
+        if recorder is None:
+            response = self.get_response(request)
+        else:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        return self._record(request, response, start, recorder)
+
+    async def __acall__(self, request):
+        recorder = self._recorder()
+        start = time.perf_counter()
+        if recorder is None:
+            response = await self.get_response(request)
+        else:
+            with connection.execute_wrapper(recorder):
+                response = await self.get_response(request)
+        return self._record(request, response, start, recorder)
+
+    def _recorder(self):
+        return QueryRecorder() if random.random() < self.sample_rate else None
+
+    def _record(self, request, response, start, recorder):
+        duration = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        performance_stats.record(
+            view, request.path, duration, recorder and recorder.queries
+        )
+
+        timing = [f'app;dur={duration:.1f};desc="{view}"']
+        if recorder is not None:
+            timing.append(
+                f'db;dur={sum(ms for _, ms in recorder.queries):.1f};desc="{len(recorder.queries)} queries"'
+            )
+        response["Server-Timing"] = ", ".join(timing)
+        return response
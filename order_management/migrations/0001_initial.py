@@ -0,0 +1,159 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Nombre')),
+                ('scheduled_for', models.DateField(verbose_name='Fecha')),
+                ('active', models.BooleanField(default=False, verbose_name='Activo')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rate', models.FloatField(verbose_name='Tasa de cambio')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha de creación')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_number', models.CharField(max_length=30, verbose_name='Destinatario')),
+                ('body', models.TextField(verbose_name='Mensaje')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de envío')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próximo intento')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Representative',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False, unique=True, verbose_name='ID')),
+                ('first_name', models.CharField(blank=True, max_length=100, null=True, verbose_name='Nombre')),
+                ('phone_code', models.CharField(max_length=3, verbose_name='Código telefónico')),
+                ('phone_number', models.CharField(max_length=10, verbose_name='Nro. de teléfono')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_method', models.SmallIntegerField(default=0, verbose_name='Método de pago')),
+                ('reference_number', models.IntegerField(blank=True, null=True, verbose_name='Nro. de referencia')),
+                ('rejected', models.BooleanField(default=False, verbose_name='Orden rechazada')),
+                ('closed', models.BooleanField(default=False, verbose_name='Orden cerrada')),
+                ('checked', models.BooleanField(default=False, verbose_name='Orden confirmada')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('amount_bs', models.FloatField(blank=True, null=True, verbose_name='Monto en Bs.')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='order_management.event', verbose_name='Evento')),
+                ('exchange_rate', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='order_management.exchangerate', verbose_name='Tasa de cambio')),
+                ('representative', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='order_management.representative', verbose_name='Representante')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.SmallIntegerField(choices=[(0, 'Confirmada'), (1, 'Rechazada'), (2, 'Pendiente')], verbose_name='Estado')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_changes', to='order_management.order', verbose_name='Orden')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Producto')),
+                ('price', models.FloatField(verbose_name='Precio')),
+                ('stock', models.IntegerField(verbose_name='Disponible')),
+                ('hidden', models.BooleanField(default=False, verbose_name='Oculto')),
+                ('event', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='order_management.event', verbose_name='Evento')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EventProductStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grade', models.CharField(choices=[('1er. grado', '1er. grado'), ('2do. grado', '2do. grado'), ('3er. grado', '3er. grado'), ('4to. grado', '4to. grado'), ('5to. grado', '5to. grado'), ('6to. grado', '6to. grado'), ('1er. año', '1er. año'), ('2do. año', '2do. año'), ('3er. año', '3er. año'), ('4to. año', '4to. año'), ('5to. año', '5to. año')], max_length=15, verbose_name='Grado')),
+                ('sold', models.IntegerField(default=0, verbose_name='Vendidos')),
+                ('revenue', models.FloatField(default=0, verbose_name='Ingresos ($)')),
+                ('revenue_bs', models.FloatField(default=0, verbose_name='Ingresos (Bs.)')),
+                ('event', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='product_stats', to='order_management.event', verbose_name='Evento')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='order_management.product', verbose_name='Producto')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Student',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Estudiante')),
+                ('grade', models.CharField(choices=[('1er. grado', '1er. grado'), ('2do. grado', '2do. grado'), ('3er. grado', '3er. grado'), ('4to. grado', '4to. grado'), ('5to. grado', '5to. grado'), ('6to. grado', '6to. grado'), ('1er. año', '1er. año'), ('2do. año', '2do. año'), ('3er. año', '3er. año'), ('4to. año', '4to. año'), ('5to. año', '5to. año')], max_length=15, verbose_name='Grado')),
+                ('section', models.CharField(choices=[('U', 'U'), ('A', 'A'), ('B', 'B')], max_length=1, verbose_name='Sección')),
+                ('representative', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='students', to='order_management.representative', verbose_name='Representante')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Cantidad')),
+                ('unit_price', models.FloatField(blank=True, null=True, verbose_name='Precio unitario')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orderlines', to='order_management.order', verbose_name='Orden')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orderlines', to='order_management.product', verbose_name='Producto')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orderlines', to='order_management.student', verbose_name='Estudiante')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['event', 'hidden'], name='order_manag_event_i_0792e5_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='eventproductstats',
+            constraint=models.UniqueConstraint(fields=('product', 'grade'), name='unique_product_grade_stats'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['event', 'closed', 'rejected'], name='order_manag_event_i_5ac8f7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['event', 'closed', '-id'], name='order_manag_event_i_ac8877_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['reference_number'], name='order_manag_referen_b84218_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('closed', False)), fields=('representative', 'event'), name='unique_open_order'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['grade', 'section'], name='order_manag_grade_160b18_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='student',
+            constraint=models.UniqueConstraint(fields=('representative', 'name'), name='unique_student_name'),
+        ),
+    ]
@@ -1,7 +1,31 @@
-from django.db import models
-from django.db.models.signals import post_save, pre_delete
+import time
+from collections import Counter
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, OuterRef, Prefetch, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from .events import publish_event
+
+
+def cache_version(key):
+    return cache.get_or_set(
+        f"{key}:version", time.time_ns, settings.CACHE_VERSION_TIMEOUT
+    )
+
+
+def bump_cache_version(*keys):
+    transaction.on_commit(
+        lambda: cache.set_many(
+            {f"{key}:version": time.time_ns() for key in keys},
+            settings.CACHE_VERSION_TIMEOUT,
+        )
+    )
 
 
 class Event(models.Model):
@@ -15,7 +39,18 @@ class Event(models.Model):
 
 class ExchangeRate(models.Model):
     rate = models.FloatField(_("Tasa de cambio"))
-    created_at = models.DateTimeField(_("Fecha de creación"), auto_now_add=True)
+    created_at = models.DateTimeField(
+        _("Fecha de creación"), auto_now_add=True, db_index=True
+    )
+
+    @classmethod
+    def current(cls):
+        key = f"exchange_rate:{cache_version("exchange_rate")}"
+        exchange_rate = cache.get(key, False)
+        if exchange_rate is False:
+            exchange_rate = cls.objects.order_by("-created_at").first()
+            cache.set(key, exchange_rate, settings.CACHE_VERSION_TIMEOUT)
+        return exchange_rate
 
     def __str__(self):
         return f"{str(self.rate)} Bs. | {self.created_at.strftime("%d/%m/%Y")}"
@@ -63,6 +98,14 @@ class Student(models.Model):
         null=True,
     )
 
+    class Meta:
+        indexes = [models.Index(fields=["grade", "section"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["representative", "name"], name="unique_student_name"
+            )
+        ]
+
     def __str__(self):
         return self.name
 
@@ -76,15 +119,91 @@ class Product(models.Model):
     stock = models.IntegerField(_("Disponible"))
     hidden = models.BooleanField(_("Oculto"), default=False)
 
+    class Meta:
+        indexes = [models.Index(fields=["event", "hidden"])]
+
     def __str__(self):
         return self.name
 
 
+def order_total(order_ref=OuterRef("pk")):
+    return Subquery(
+        OrderLine.objects.filter(order=order_ref)
+        .order_by()
+        .values("order")
+        .annotate(total=Sum(F("unit_price") * F("quantity")))
+        .values("total")
+    )
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_total(self):
+        return self.annotate(total=order_total())
+
+    def get_open(self, representative_id, event_id):
+        # unique_open_order impide que dos peticiones simultáneas creen dos
+        # carritos; la que pierde vuelve a buscar el de la otra.
+        for attempt in range(3):
+            try:
+                with transaction.atomic():
+                    return self.get_or_create(
+                        representative_id=representative_id,
+                        event_id=event_id,
+                        closed=False,
+                    )[0]
+            except IntegrityError:
+                if attempt == 2:
+                    raise
+
+    def update_status(self, status, user=None):
+        """
+        Aplica un estado de revisión a las órdenes cerradas del queryset con un
+        solo UPDATE y deja constancia de cada cambio. Devuelve las órdenes
+        modificadas como pares (pk, event_id).
+        """
+        fields = Order.STATUS_FIELDS[status]
+        with transaction.atomic():
+            changed = list(
+                self.filter(closed=True)
+                .exclude(**fields)
+                .select_for_update()
+                .values_list("pk", "event_id")
+            )
+            pks = [pk for pk, _ in changed]
+            with track_product_stats(OrderLine.objects.filter(order_id__in=pks)):
+                Order.objects.filter(pk__in=pks).update(**fields)
+            OrderStatusChange.objects.bulk_create(
+                OrderStatusChange(order_id=pk, user=user, status=status) for pk in pks
+            )
+            bump_cache_version(*{f"preparation:{event_id}" for _, event_id in changed})
+        return changed
+
+    def with_lines(self):
+        return self.select_related("representative", "exchange_rate").prefetch_related(
+            Prefetch(
+                "orderlines",
+                queryset=OrderLine.objects.select_related(
+                    "student", "product"
+                ).order_by("student_id", "pk"),
+            )
+        )
+
+
 class Order(models.Model):
     PAYMENT_METHOD_CHOICES = [
         (0, "Pago móvil"),
         (1, "Efectivo"),
     ]
+    STATUS_CHOICES = [
+        (0, "Confirmada"),
+        (1, "Rechazada"),
+        (2, "Pendiente"),
+    ]
+    STATUS_FIELDS = {
+        0: {"checked": True, "rejected": False},
+        1: {"checked": False, "rejected": True},
+        2: {"checked": False, "rejected": False},
+    }
     payment_method = models.SmallIntegerField(_("Método de pago"), default=0)
     representative = models.ForeignKey(
         Representative,
@@ -108,11 +227,216 @@ class Order(models.Model):
         blank=True,
         null=True,
     )
+    amount_bs = models.FloatField(_("Monto en Bs."), blank=True, null=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["event", "closed", "rejected"]),
+            models.Index(fields=["event", "closed", "-id"]),
+            models.Index(fields=["reference_number"]),
+        ]
+        constraints = [
+            # Índice parcial: un solo carrito abierto por representante y evento.
+            models.UniqueConstraint(
+                fields=["representative", "event"],
+                condition=Q(closed=False),
+                name="unique_open_order",
+            )
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic(), track_product_stats(self.orderlines.all()):
+            super().save(*args, **kwargs)
+            bump_cache_version(f"preparation:{self.event_id}")
 
     def __str__(self):
         return f'ORDEN #{self.pk} - {self.representative.first_name} - {"Cerrada" if self.closed else "Abierta"} {self.exchange_rate}'
 
 
+class OrderStatusChange(models.Model):
+    order = models.ForeignKey(
+        Order,
+        verbose_name=_("Orden"),
+        on_delete=models.CASCADE,
+        related_name="status_changes",
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_("Usuario"),
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+    )
+    status = models.SmallIntegerField(_("Estado"), choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField(_("Fecha de creación"), auto_now_add=True)
+
+    def __str__(self):
+        return f"ORDEN #{self.order_id} | {self.get_status_display()}"
+
+
+class Notification(models.Model):
+    to_number = models.CharField(_("Destinatario"), max_length=30)
+    body = models.TextField(_("Mensaje"))
+    created_at = models.DateTimeField(_("Fecha de creación"), auto_now_add=True)
+    sent_at = models.DateTimeField(_("Fecha de envío"), blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(_("Intentos"), default=0)
+    next_attempt_at = models.DateTimeField(_("Próximo intento"), default=timezone.now)
+    error = models.TextField(_("Error"), blank=True)
+
+    def __str__(self):
+        return f"{self.to_number} | {"Enviada" if self.sent_at else "Pendiente"}"
+
+
+class OutOfStock(Exception):
+    def __init__(self, products):
+        self.products = products
+        super().__init__(f"Sin disponibilidad: {products}")
+
+
+def _stock_changed(quantities, sign):
+    products = Product.objects.filter(pk__in=quantities).values(
+        "pk", "event_id", "stock"
+    )
+    # El catálogo solo muestra si hay disponibilidad, así que basta invalidarlo
+    # cuando un producto se agota o vuelve a estar disponible.
+    catalogues = set()
+    for product in products:
+        previous = product["stock"] - sign * quantities[product["pk"]]
+        if (product["stock"] > 0) != (previous > 0):
+            catalogues.add(f"catalogue:{product["event_id"]}")
+        publish_event(
+            product["event_id"],
+            "stock-changed",
+            product=product["pk"],
+            stock=product["stock"],
+        )
+    if catalogues:
+        bump_cache_version(*catalogues)
+
+
+def reserve_stock(quantities):
+    """
+    Descuenta del stock las cantidades {product_id: cantidad} con un UPDATE
+    condicional por producto. Si alguno no alcanza no se descuenta ninguno.
+    """
+    quantities = Counter(quantities)
+    sold_out = []
+    with transaction.atomic():
+        for product_id, quantity in sorted(quantities.items()):
+            updated = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+                stock=F("stock") - quantity
+            )
+            if not updated:
+                sold_out.append(product_id)
+        if sold_out:
+            raise OutOfStock(sold_out)
+        _stock_changed(quantities, -1)
+
+
+def release_stock(quantities):
+    quantities = Counter(quantities)
+    with transaction.atomic():
+        for product_id, quantity in sorted(quantities.items()):
+            Product.objects.filter(pk=product_id).update(stock=F("stock") + quantity)
+        _stock_changed(quantities, 1)
+
+
+def _product_quantities(lines):
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    return quantities
+
+
+def _product_prices(product_ids):
+    return dict(
+        Product.objects.filter(pk__in=set(product_ids)).values_list("pk", "price")
+    )
+
+
+class OrderLineQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic():
+            reserve_stock(
+                _product_quantities((obj.product_id, obj.quantity) for obj in objs)
+            )
+            prices = _product_prices(
+                obj.product_id for obj in objs if obj.unit_price is None
+            )
+            for obj in objs:
+                if obj.unit_price is None:
+                    obj.unit_price = prices[obj.product_id]
+            created = super().bulk_create(objs, *args, **kwargs)
+            EventProductStats.apply_diff(
+                {}, product_stats(self.filter(pk__in=[obj.pk for obj in created]))
+            )
+            return created
+
+    def add_items(self, order, items):
+        """
+        Añade {(student_id, product_id): cantidad} a la orden sumando sobre las
+        líneas que ya existan al precio actual, con una sola reserva de stock
+        por producto.
+        """
+        items = Counter(items)
+        lines = self.filter(
+            order=order,
+            student_id__in={student_id for student_id, _ in items},
+            product_id__in={product_id for _, product_id in items},
+        )
+        with transaction.atomic(), track_product_stats(lines):
+            reserve_stock(
+                _product_quantities(
+                    (product_id, quantity)
+                    for (_, product_id), quantity in items.items()
+                )
+            )
+            prices = _product_prices(product_id for _, product_id in items)
+            existing = lines.values_list("pk", "student_id", "product_id", "unit_price")
+            for pk, student_id, product_id, unit_price in existing:
+                if unit_price != prices[product_id]:
+                    continue
+                quantity = items.pop((student_id, product_id), 0)
+                if quantity:
+                    self.filter(pk=pk).update(quantity=F("quantity") + quantity)
+            return super().bulk_create(
+                OrderLine(
+                    order=order,
+                    student_id=student_id,
+                    product_id=product_id,
+                    quantity=quantity,
+                    unit_price=prices[product_id],
+                )
+                for (student_id, product_id), quantity in items.items()
+            )
+
+    def delete(self):
+        with transaction.atomic():
+            # Se bloquean y releen las líneas para que un borrado repetido o
+            # concurrente no libere el stock de líneas que ya no existen.
+            lines = list(
+                self.select_for_update(of=("self",)).values_list(
+                    "pk", "product_id", "quantity"
+                )
+            )
+            if not lines:
+                return 0, {}
+            locked = OrderLine.objects.filter(pk__in=[pk for pk, _, _ in lines])
+            with track_product_stats(locked):
+                deleted = super(OrderLineQuerySet, locked).delete()
+                release_stock(
+                    _product_quantities(
+                        (product_id, quantity) for _, product_id, quantity in lines
+                    )
+                )
+        return deleted
+
+
 class OrderLine(models.Model):
     order = models.ForeignKey(
         Order,
@@ -132,16 +456,172 @@ class OrderLine(models.Model):
         on_delete=models.CASCADE,
         related_name="orderlines",
     )
+    quantity = models.PositiveIntegerField(_("Cantidad"), default=1)
+    unit_price = models.FloatField(_("Precio unitario"), blank=True, null=True)
+
+    objects = OrderLineQuerySet.as_manager()
 
+    @property
+    def subtotal(self):
+        unit_price = self.product.price if self.unit_price is None else self.unit_price
+        return unit_price * self.quantity
 
-@receiver(post_save, sender=OrderLine)
-def orderline_post_save_receiver(sender, instance, created, **kwargs):
-    if created:
-        instance.product.stock -= 1
-        instance.product.save()
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.product.price
+        with transaction.atomic():
+            previous = None
+            stats = {}
+            if not self._state.adding:
+                stats = product_stats(OrderLine.objects.filter(pk=self.pk))
+                previous = (
+                    OrderLine.objects.filter(pk=self.pk)
+                    .values_list("product_id", "quantity")
+                    .first()
+                )
+            if previous != (self.product_id, self.quantity):
+                if previous:
+                    release_stock(_product_quantities([previous]))
+                reserve_stock({self.product_id: self.quantity})
+            super().save(*args, **kwargs)
+            EventProductStats.apply_diff(
+                stats, product_stats(OrderLine.objects.filter(pk=self.pk))
+            )
+
+    def delete(self, *args, **kwargs):
+        lines = OrderLine.objects.filter(pk=self.pk)
+        with transaction.atomic():
+            quantity = (
+                lines.select_for_update().values_list("quantity", flat=True).first()
+            )
+            if quantity is None:
+                return 0, {}
+            with track_product_stats(lines):
+                deleted = super().delete(*args, **kwargs)
+                release_stock({self.product_id: quantity})
+        return deleted
+
+
+class EventProductStats(models.Model):
+    event = models.ForeignKey(
+        Event,
+        verbose_name=_("Evento"),
+        on_delete=models.CASCADE,
+        related_name="product_stats",
+        blank=True,
+        null=True,
+    )
+    product = models.ForeignKey(
+        Product,
+        verbose_name=_("Producto"),
+        on_delete=models.CASCADE,
+        related_name="stats",
+    )
+    grade = models.CharField(_("Grado"), max_length=15, choices=Student.GRADE_CHOICES)
+    sold = models.IntegerField(_("Vendidos"), default=0)
+    revenue = models.FloatField(_("Ingresos ($)"), default=0)
+    revenue_bs = models.FloatField(_("Ingresos (Bs.)"), default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "grade"], name="unique_product_grade_stats"
+            )
+        ]
+
+    @classmethod
+    def apply_diff(cls, before, after):
+        changes = {}
+        for key in before.keys() | after.keys():
+            change = [
+                round(new - old, 6)
+                for old, new in zip(
+                    before.get(key, (0, 0, 0)), after.get(key, (0, 0, 0))
+                )
+            ]
+            if any(change):
+                changes[key] = change
+        if not changes:
+            return
+
+        cls.objects.bulk_create(
+            [
+                cls(event_id=event_id, product_id=product_id, grade=grade)
+                for event_id, product_id, grade in changes
+            ],
+            ignore_conflicts=True,
+        )
+        for (event_id, product_id, grade), (
+            sold,
+            revenue,
+            revenue_bs,
+        ) in changes.items():
+            cls.objects.filter(product_id=product_id, grade=grade).update(
+                sold=F("sold") + sold,
+                revenue=F("revenue") + revenue,
+                revenue_bs=F("revenue_bs") + revenue_bs,
+            )
+
+
+def product_stats(lines):
+    """
+    Ventas por (evento, producto, grado) de las líneas dadas. Las órdenes
+    rechazadas no cuentan y los Bs. solo se cuentan al cerrar la orden.
+    """
+    amount = Coalesce("unit_price", "product__price") * F("quantity")
+    rows = (
+        lines.exclude(order__rejected=True)
+        .order_by()
+        .values("product__event_id", "product_id", "student__grade")
+        .annotate(
+            units=Sum("quantity"),
+            amount=Sum(amount),
+            amount_bs=Sum(
+                Case(
+                    When(
+                        order__closed=True,
+                        then=amount * F("order__exchange_rate__rate"),
+                    ),
+                    default=0.0,
+                    output_field=models.FloatField(),
+                )
+            ),
+        )
+    )
+    return {
+        (row["product__event_id"], row["product_id"], row["student__grade"]): (
+            row["units"],
+            row["amount"] or 0,
+            row["amount_bs"] or 0,
+        )
+        for row in rows
+    }
+
+
+@contextmanager
+def track_product_stats(lines):
+    before = product_stats(lines)
+    yield
+    EventProductStats.apply_diff(before, product_stats(lines))
+
+
+@receiver([post_save, post_delete], sender=ExchangeRate)
+def exchange_rate_changed_receiver(sender, **kwargs):
+    bump_cache_version("exchange_rate")
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed_receiver(sender, instance, **kwargs):
+    bump_cache_version(f"catalogue:{instance.event_id}")
 
 
 @receiver(pre_delete, sender=OrderLine)
-def orderline_pre_delete_receiver(sender, instance, **kwargs):
-    instance.product.stock += 1
-    instance.product.save()
+def orderline_pre_delete_receiver(sender, instance, origin=None, **kwargs):
+    # Los borrados directos de líneas liberan el stock en bloque; aquí solo
+    # llegan las líneas borradas en cascada (p. ej. al eliminar una orden).
+    if isinstance(origin, (OrderLine, OrderLineQuerySet)):
+        return
+    EventProductStats.apply_diff(
+        product_stats(OrderLine.objects.filter(pk=instance.pk)), {}
+    )
+    release_stock({instance.product_id: instance.quantity})
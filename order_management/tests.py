@@ -1,3 +1,933 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import threading
+import time
+import xlsxwriter
+import zipfile
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .events import event_channel, get_broker
+from .management.commands.explain_queries import full_scans, hot_queries
+from .middleware import PerformanceStats, performance_stats
+from .utils import (
+    FakeTwilioClient,
+    InvalidSpreadsheet,
+    _parse_amount,
+    get_twilio_client,
+    import_roster,
+    queue_notification,
+    read_spreadsheet,
+    reconcile_payments,
+    send_pending_notifications,
+)
+from .models import (
+    Event,
+    EventProductStats,
+    ExchangeRate,
+    Notification,
+    Order,
+    OrderLine,
+    OutOfStock,
+    Product,
+    Representative,
+    Student,
+)
 
-# Create your tests here.
+
+def create_orders(event, products, count, lines=3, closed=True, start=0):
+    orders = []
+    for i in range(start, start + count):
+        representative = Representative.objects.create(
+            id=584120000000 + i,
+            phone_code="58",
+            phone_number=str(4120000000 + i),
+            first_name=f"Representante {i}",
+        )
+        students = [
+            Student.objects.create(
+                name=f"Estudiante {i}{section}",
+                grade=grade,
+                section=section,
+                representative=representative,
+            )
+            for grade, section in [("1er. grado", "A"), ("2do. grado", "B")]
+        ]
+        order = Order.objects.create(
+            representative=representative,
+            event=event,
+            closed=closed,
+            exchange_rate=ExchangeRate.current(),
+            reference_number=1000 + i,
+        )
+        OrderLine.objects.add_items(
+            order,
+            {
+                (students[j % 2].pk, products[j % len(products)].pk): 1
+                for j in range(lines)
+            },
+        )
+        orders.append(order)
+    return orders
+
+
+def xlsx_file(rows, sheet="sheet1.xml"):
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {"in_memory": True})
+    worksheet = workbook.add_worksheet("Pagos")
+    for i, row in enumerate(rows):
+        worksheet.write_row(i, 0, row)
+    workbook.close()
+    if sheet == "sheet1.xml":
+        output.seek(0)
+        return output
+
+    # Otros programas no siempre llaman sheet1.xml a la primera hoja.
+    renamed = io.BytesIO()
+    with zipfile.ZipFile(output) as source, zipfile.ZipFile(renamed, "w") as target:
+        for name in source.namelist():
+            data = source.read(name).replace(b"sheet1.xml", sheet.encode())
+            target.writestr(name.replace("sheet1.xml", sheet), data)
+    renamed.seek(0)
+    return renamed
+
+
+class EventDataMixin:
+    def setUp(self):
+        cache.clear()
+        self.event = Event.objects.create(
+            name="Evento", scheduled_for=datetime.date.today(), active=True
+        )
+        self.exchange_rate = ExchangeRate.objects.create(rate=40)
+        self.products = [
+            Product.objects.create(
+                name=f"Producto {i}", price=1.5 + i, stock=1000, event=self.event
+            )
+            for i in range(4)
+        ]
+        self.staff = get_user_model().objects.create_user("staff", is_staff=True)
+
+
+class QueryBudgetTests(EventDataMixin, TestCase):
+    """Las vistas de listas no deben hacer consultas por fila."""
+
+    def assertQueryBudget(self, budget, url, params):
+        # El mismo número de consultas con 3 y con 10 pedidos.
+        for count, start in [(3, 0), (7, 3)]:
+            create_orders(self.event, self.products, count, start=start)
+            cache.clear()
+            data = params()
+            with self.assertNumQueries(budget):
+                response = self.client.get(url, data)
+            self.assertEqual(response.status_code, 200)
+
+    def test_staff_order_list(self):
+        self.client.force_login(self.staff)
+        self.assertQueryBudget(
+            4, reverse("staff-order-list"), lambda: {"event": self.event.pk}
+        )
+
+    def test_order_list(self):
+        representative = Representative.objects.create(
+            id=584160000000, phone_code="58", phone_number="4160000000"
+        )
+
+        def params():
+            Order.objects.filter(event=self.event).update(representative=representative)
+            return {"representative": representative.pk, "event": self.event.pk}
+
+        self.assertQueryBudget(2, reverse("order-list"), params)
+
+    def test_cart(self):
+        def params():
+            Order.objects.filter(event=self.event).update(closed=True)
+            order = Order.objects.filter(event=self.event).last()
+            data = {"representative": order.representative_id, "event": self.event.pk}
+            # La primera visita crea el carrito y la sesión.
+            self.client.get(reverse("cart"), data)
+            return data
+
+        self.assertQueryBudget(7, reverse("cart"), params)
+
+
+class RepresentativeCreateTests(EventDataMixin, TestCase):
+    def create(self, phone_number, first_name="", phone_code="58"):
+        return self.client.post(
+            reverse("representative-create"),
+            {
+                "event": self.event.pk,
+                "phone_code": phone_code,
+                "phone_number": phone_number,
+                "first_name": first_name,
+            },
+        )
+
+    def test_phone_formats(self):
+        for phone_number in [
+            "04121234567",
+            "0412-123.45.67",
+            "+58 412 1234567",
+            "584121234567",
+            "4121234567",
+        ]:
+            with self.subTest(phone_number):
+                response = self.create(phone_number, "Ana")
+                self.assertTemplateUsed(response, "order_management/cart.html")
+                self.assertEqual(response.context["representative"], 584121234567)
+        representative = Representative.objects.get()
+        self.assertEqual(
+            (representative.phone_code, representative.phone_number),
+            ("58", "4121234567"),
+        )
+
+    def test_invalid_phone(self):
+        for phone_number in ["0412", "+58 412 1234567 890"]:
+            with self.subTest(phone_number):
+                response = self.create(phone_number, "Ana")
+                self.assertContains(response, "Teléfono no válido")
+        self.assertFalse(Representative.objects.exists())
+
+    def test_new_representative_needs_name(self):
+        response = self.create("04121234567")
+        self.assertTrue(response.context["needs_name"])
+        self.assertContains(response, 'value="4121234567"')
+        self.assertFalse(Representative.objects.exists())
+
+    def test_returning_representative_keeps_name(self):
+        Representative.objects.create(
+            id=584121234567,
+            first_name="Ana",
+            phone_code="58",
+            phone_number="4121234567",
+        )
+        for first_name in ["", "Otra"]:
+            with self.subTest(first_name):
+                response = self.create("0412 1234567", first_name)
+                self.assertTemplateUsed(response, "order_management/cart.html")
+        self.assertEqual(Representative.objects.get().first_name, "Ana")
+
+
+class CartTests(EventDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.representative = Representative.objects.create(
+            id=584160000000, phone_code="58", phone_number="4160000000"
+        )
+        self.data = {"representative": self.representative.pk, "event": self.event.pk}
+
+    def test_cart_reuses_session_order(self):
+        order = self.client.get(reverse("cart"), self.data).context["order"]
+        self.assertEqual(
+            self.client.session[f"cart:{self.event.pk}:{self.representative.pk}"],
+            order.pk,
+        )
+        response = self.client.get(reverse("cart"), self.data)
+        self.assertEqual(response.context["order"], order)
+
+    def test_closed_cart_opens_new_order(self):
+        order = self.client.get(reverse("cart"), self.data).context["order"]
+        Order.objects.filter(pk=order.pk).update(closed=True)
+        new_order = self.client.get(reverse("cart"), self.data).context["order"]
+        self.assertNotEqual(new_order, order)
+        self.assertFalse(new_order.closed)
+        self.assertEqual(
+            self.client.session[f"cart:{self.event.pk}:{self.representative.pk}"],
+            new_order.pk,
+        )
+
+
+class StaffOrderSearchTests(EventDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.orders = create_orders(self.event, self.products, 10)
+        self.client.force_login(self.staff)
+
+    def search(self, q):
+        response = self.client.get(
+            reverse("staff-order-list"), {"event": self.event.pk, "q": q}
+        )
+        return [order.pk for order in response.context["order_list"]]
+
+    def test_search_by_phone(self):
+        for q in ["4120000005", "04120000005", "584120000005"]:
+            with self.subTest(q):
+                self.assertEqual(self.search(q), [self.orders[5].pk])
+
+    def test_search_by_reference_number(self):
+        self.assertEqual(self.search("1007"), [self.orders[7].pk])
+
+    def test_search_by_student_name(self):
+        self.assertEqual(self.search("estudiante 3a"), [self.orders[3].pk])
+
+
+class OrderStatusTests(EventDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = create_orders(self.event, self.products, 1)[0]
+        self.client.force_login(self.staff)
+
+    def update_status(self, **params):
+        return self.client.get(
+            reverse("order-update-status", args=[self.order.pk]), params
+        )
+
+    def test_update_status(self):
+        response = self.update_status(status=1)
+        self.assertEqual(response["HX-Trigger"], "orderStatusUpdated")
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.rejected)
+        self.assertEqual(self.order.status_changes.get().status, 1)
+
+    def test_invalid_status(self):
+        for params in [{}, {"status": "x"}, {"status": 3}]:
+            with self.subTest(params):
+                self.assertEqual(self.update_status(**params).status_code, 400)
+        self.assertFalse(self.order.status_changes.exists())
+
+    def test_unknown_order(self):
+        response = self.client.get(
+            reverse("order-update-status", args=[self.order.pk + 1]), {"status": 0}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_update_status(self):
+        url = reverse("order-bulk-update-status")
+        self.assertEqual(self.client.get(url).status_code, 405)
+        response = self.client.post(url, {"order": [self.order.pk], "status": 0})
+        self.assertEqual(response["HX-Trigger"], "orderStatusUpdated")
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.checked)
+
+
+class OrderLineCreateTests(EventDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = create_orders(self.event, self.products, 1, closed=False)[0]
+        self.student = self.order.representative.students.first()
+
+    def create(self, product):
+        return self.client.post(
+            reverse("orderline-create"),
+            {
+                "order": self.order.pk,
+                "student": self.student.pk,
+                "product": product.pk,
+            },
+        )
+
+    def test_create(self):
+        response = self.create(self.products[0])
+        self.assertEqual(response["HX-Trigger"], "orderlineCreated")
+
+    def test_hidden_product_rejected(self):
+        product = self.products[0]
+        product.hidden = True
+        product.save()
+        lines = self.order.orderlines.count()
+        response = self.create(product)
+        self.assertNotIn("HX-Trigger", response)
+        self.assertEqual(self.order.orderlines.count(), lines)
+
+
+class StaffEventStreamTests(EventDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("staff-event-stream", args=[self.event.pk])
+
+    def test_wsgi_has_no_stream(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 204)
+        response = self.client.get(reverse("staff-event", args=[self.event.pk]))
+        self.assertNotContains(response, "staff-event-stream")
+
+    async def test_asgi_stream(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        content = aiter(response.streaming_content)
+        self.assertEqual(await anext(content), b"retry: 3000\n\n")
+        get_broker().publish(event_channel(self.event.pk), "order-closed", {"order": 1})
+        self.assertEqual(
+            await asyncio.wait_for(anext(content), 5),
+            b'event: order-closed\ndata: {"order": 1}\n\n',
+        )
+        # Como al desconectarse el cliente: se cancela la lectura pendiente.
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(anext(content), 0.1)
+
+    async def test_asgi_page_opens_stream(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(
+            reverse("staff-event", args=[self.event.pk])
+        )
+        self.assertContains(response, "staff-event-stream")
+
+    async def test_stream_requires_staff(self):
+        user = await get_user_model().objects.acreate_user("representante")
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+
+class ProductStatsTests(EventDataMixin, TestCase):
+    def stats(self):
+        return {
+            (stats.product_id, stats.grade): (
+                stats.sold,
+                round(stats.revenue, 6),
+                round(stats.revenue_bs, 6),
+            )
+            for stats in EventProductStats.objects.filter(event=self.event)
+            if stats.sold
+        }
+
+    @override_settings(ORDER_NOTIFICATION_RECIPIENTS=[])
+    def test_incremental_stats_match_rebuild(self):
+        order = create_orders(self.event, self.products, 1, lines=0, closed=False)[0]
+        student = order.representative.students.first()
+        self.client.post(
+            reverse("orderline-bulk-create"),
+            {
+                "order": order.pk,
+                "student": [student.pk, student.pk],
+                "product": [self.products[0].pk, self.products[1].pk],
+                "quantity": [4, 1],
+            },
+        )
+        for line in order.orderlines.all():
+            self.client.post(reverse("orderline-delete"), {"orderline": line.pk})
+        self.client.post(
+            reverse("order-close", args=[order.pk]),
+            {
+                "payment_method": 0,
+                "reference_number": 1234,
+                "exchange_rate": self.exchange_rate.pk,
+            },
+        )
+
+        incremental = self.stats()
+        self.assertEqual(
+            incremental, {(self.products[0].pk, student.grade): (3, 4.5, 180)}
+        )
+        call_command("rebuild_stats", stdout=io.StringIO())
+        self.assertEqual(self.stats(), incremental)
+
+
+class FailingTwilioClient(FakeTwilioClient):
+    def create(self, to, from_, body):
+        raise ConnectionError("Twilio no responde")
+
+
+@override_settings(
+    TWILIO_FAKE=True, NOTIFICATION_MAX_ATTEMPTS=3, NOTIFICATION_RETRY_DELAY=30
+)
+class NotificationTests(TestCase):
+    def setUp(self):
+        get_twilio_client.cache_clear()
+        self.addCleanup(get_twilio_client.cache_clear)
+
+    def test_send_groups_by_recipient(self):
+        queue_notification("Orden 1", ["+584120000001", "+584120000002"])
+        queue_notification("Orden 2", ["+584120000001"])
+        self.assertEqual(send_pending_notifications(), 3)
+        self.assertEqual(
+            [(m["to"], m["body"]) for m in get_twilio_client().sent],
+            [
+                ("whatsapp:+584120000001", "Orden 1\n\nOrden 2"),
+                ("whatsapp:+584120000002", "Orden 1"),
+            ],
+        )
+        self.assertFalse(Notification.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(send_pending_notifications(), 0)
+
+    def test_digests_fit_whatsapp_limit(self):
+        for i in range(3):
+            queue_notification(str(i) * 700, ["+584120000001"])
+        send_pending_notifications()
+        self.assertEqual(
+            [len(m["body"]) for m in get_twilio_client().sent], [1402, 700]
+        )
+
+    def test_pending_rows_are_claimed_while_sending(self):
+        queue_notification("Orden 1", ["+584120000001"])
+        due = []
+
+        def create(to, from_, body):
+            due.append(
+                Notification.objects.filter(next_attempt_at__lte=timezone.now()).count()
+            )
+
+        with mock.patch.object(get_twilio_client(), "create", create):
+            send_pending_notifications()
+        self.assertEqual(due, [0])
+
+    def test_failure_backs_off(self):
+        queue_notification("Orden 1", ["+584120000001"])
+        with mock.patch(
+            "order_management.utils.get_twilio_client", FailingTwilioClient
+        ):
+            for delay in [30, 60]:
+                start = timezone.now()
+                self.assertEqual(send_pending_notifications(), 0)
+                notification = Notification.objects.get()
+                self.assertIsNone(notification.sent_at)
+                self.assertEqual(notification.error, "Twilio no responde")
+                self.assertAlmostEqual(
+                    notification.next_attempt_at,
+                    start + datetime.timedelta(seconds=delay),
+                    delta=datetime.timedelta(seconds=5),
+                )
+                # No se reintenta antes de tiempo.
+                self.assertEqual(send_pending_notifications(), 0)
+                self.assertEqual(
+                    Notification.objects.get().attempts, notification.attempts
+                )
+                Notification.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(Notification.objects.get().attempts, 2)
+
+    def test_abandoned_after_max_attempts(self):
+        queue_notification("Orden 1", ["+584120000001"])
+        with mock.patch(
+            "order_management.utils.get_twilio_client", FailingTwilioClient
+        ):
+            for _ in range(5):
+                send_pending_notifications()
+                Notification.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(Notification.objects.get().attempts, 3)
+        self.assertEqual(send_pending_notifications(), 0)
+        self.assertEqual(get_twilio_client().sent, [])
+
+
+class ReadSpreadsheetTests(TestCase):
+    rows = [["Referencia", "Monto"], ["1001", "1.234,56"], ["1002", "50"]]
+
+    def test_csv(self):
+        for delimiter in [",", ";", "\t"]:
+            with self.subTest(delimiter):
+                content = "\ufeff" + "\n".join(
+                    delimiter.join(f'"{value}"' for value in row) for row in self.rows
+                )
+                file = io.BytesIO(content.encode())
+                self.assertEqual(list(read_spreadsheet(file)), self.rows)
+
+    def test_xlsx(self):
+        rows = [["Teléfono", "Nombre", "Grado"], ["04121234567", "Ana"], [1234.5]]
+        for sheet in ["sheet1.xml", "pagos.xml"]:
+            with self.subTest(sheet):
+                self.assertEqual(
+                    list(read_spreadsheet(xlsx_file(rows, sheet))),
+                    [
+                        ["Teléfono", "Nombre", "Grado"],
+                        ["04121234567", "Ana"],
+                        ["1234.5"],
+                    ],
+                )
+
+    def test_invalid_xlsx(self):
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, "w") as archive:
+            archive.writestr("documento.txt", "no es un libro")
+        with self.assertRaises(InvalidSpreadsheet):
+            list(read_spreadsheet(file))
+
+
+class ImportRosterTests(TestCase):
+    header = ["Teléfono", "Representante", "Estudiante", "Grado", "Sección"]
+
+    def test_import(self):
+        imported, errors = import_roster(
+            [
+                self.header,
+                ["0412-1234567", "Ana", "Luis", "1er. grado", "a"],
+                ["+58 412 1234567", "Ana", "Luis", "2do. grado", "B"],
+                ["0412", "Ana", "Luis", "1er. grado", "A"],
+                ["04121234567", "Ana", "", "1er. grado", "A"],
+                ["04121234567", "Ana", "Eva", "Kínder", "A"],
+                ["04121234567", "Ana", "Eva", "1er. grado", "Z"],
+                [],
+            ]
+        )
+        self.assertEqual(imported, 2)
+        self.assertEqual([line for line, _ in errors], [4, 5, 6, 7])
+        student = Student.objects.get()
+        self.assertEqual(
+            (student.representative_id, student.grade, student.section),
+            (584121234567, "2do. grado", "B"),
+        )
+
+    def test_blank_name_keeps_existing(self):
+        # En el mismo lote y en lotes distintos.
+        for chunk_size in [1, 1000]:
+            with self.subTest(chunk_size=chunk_size):
+                Representative.objects.all().delete()
+                Representative.objects.create(
+                    id=584127654321,
+                    first_name="Eva",
+                    phone_code="58",
+                    phone_number="4127654321",
+                )
+                import_roster(
+                    [
+                        self.header,
+                        ["04121234567", "Ana", "Luis", "1er. grado", "A"],
+                        ["04121234567", "", "Sara", "1er. grado", "A"],
+                        ["04127654321", "", "Juan", "1er. grado", "A"],
+                        ["04140000000", "", "Pedro", "1er. grado", "A"],
+                    ],
+                    chunk_size=chunk_size,
+                )
+                self.assertEqual(
+                    dict(Representative.objects.values_list("pk", "first_name")),
+                    {584121234567: "Ana", 584127654321: "Eva", 584140000000: None},
+                )
+                self.assertEqual(Student.objects.count(), 4)
+
+
+class ReconcilePaymentsTests(EventDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.orders = create_orders(self.event, self.products, 5)
+        for order, reference_number, amount_bs in zip(
+            self.orders,
+            [1000, 1001, 2000, 2000, 3000],
+            [1234.56, 50, 10, 10, 20],
+        ):
+            order.reference_number = reference_number
+            order.amount_bs = amount_bs
+        Order.objects.bulk_update(self.orders, ["reference_number", "amount_bs"])
+        self.orders[4].payment_method = 1
+        self.orders[4].save()
+
+    def test_parse_amount(self):
+        for value, amount in [
+            ("1.234,56", 1234.56),
+            ("1,234.56", 1234.56),
+            ("Bs. 50,5", 50.5),
+            ("1234.5", 1234.5),
+            (20, 20),
+        ]:
+            with self.subTest(value):
+                self.assertEqual(_parse_amount(value), amount)
+
+    def test_reconcile(self):
+        rows = [
+            ["Monto (Bs.)", "Nro. de referencia"],
+            ["1.234,56", "001000"],
+            ["60,00", "1001"],
+            ["10", "2000"],
+            ["20", "3000"],
+            ["5", "abc"],
+            ["5"],
+        ]
+        matched, checked, unmatched = reconcile_payments(
+            self.event.pk, rows, self.staff
+        )
+        self.assertEqual((matched, checked), (1, 1))
+        self.assertEqual(
+            unmatched,
+            [
+                (3, 1001, 60, "Monto no coincide"),
+                (4, 2000, 10, "Referencia ambigua"),
+                (5, 3000, 20, "Sin coincidencia"),
+                (6, "", "", "Fila no válida"),
+                (7, "", "", "Fila no válida"),
+            ],
+        )
+        self.assertEqual(
+            list(Order.objects.filter(checked=True).values_list("pk", flat=True)),
+            [self.orders[0].pk],
+        )
+        # Volver a conciliar no repite el cambio de estado.
+        self.assertEqual(reconcile_payments(self.event.pk, rows)[:2], (1, 0))
+
+    def test_view(self):
+        self.client.force_login(self.staff)
+        url = reverse("order-reconcile", args=[self.event.pk])
+        file = xlsx_file([["Referencia", "Monto"], [1000, 1234.56]])
+        file.name = "estado.xlsx"
+        response = self.client.post(url, {"statement": file})
+        self.assertEqual(response["HX-Trigger"], "ordersReconciled")
+        self.assertEqual(response.context["checked"], 1)
+
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, "w") as archive:
+            archive.writestr("documento.txt", "no es un libro")
+        file.seek(0)
+        file.name = "estado.xlsx"
+        self.assertEqual(self.client.post(url, {"statement": file}).status_code, 400)
+
+
+class ExchangeRateCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_current_is_cached(self):
+        exchange_rate = ExchangeRate.objects.create(rate=40)
+        self.assertEqual(ExchangeRate.current(), exchange_rate)
+        with self.assertNumQueries(0):
+            self.assertEqual(ExchangeRate.current(), exchange_rate)
+
+    def test_new_rate_invalidates_cache(self):
+        ExchangeRate.objects.create(rate=40)
+        ExchangeRate.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            exchange_rate = ExchangeRate.objects.create(rate=41)
+        self.assertEqual(ExchangeRate.current(), exchange_rate)
+
+    @override_settings(CACHE_VERSION_TIMEOUT=30)
+    def test_version_expires(self):
+        ExchangeRate.objects.create(rate=40)
+        ExchangeRate.current()
+        # Sin on_commit, como en otro worker con su propia LocMemCache.
+        exchange_rate = ExchangeRate.objects.create(rate=41)
+        later = time.time() + 31
+        with mock.patch("django.core.cache.backends.locmem.time.time", lambda: later):
+            self.assertEqual(ExchangeRate.current(), exchange_rate)
+
+
+class ExplainQueriesTests(EventDataMixin, TestCase):
+    def test_hot_queries_use_indexes(self):
+        orders = create_orders(self.event, self.products, 20)
+        for name, queryset in hot_queries(
+            self.event.pk, orders[0].representative_id
+        ).items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertEqual(full_scans(plan), [], plan)
+
+
+class OrderLineQueryBudgetTests(EventDataMixin, TestCase):
+    """Las acciones del carrito hacen un número fijo de consultas."""
+
+    def setUp(self):
+        super().setUp()
+        self.order = create_orders(self.event, self.products, 1, closed=False)[0]
+        self.student = self.order.representative.students.first()
+
+    def test_orderline_bulk_create(self):
+        # Cada producto más suma su UPDATE de stock, el de su línea y el de
+        # sus estadísticas; el resto es fijo.
+        for budget, products in [(18, self.products[:1]), (21, self.products[1:3])]:
+            with self.subTest(len(products)), self.assertNumQueries(budget):
+                response = self.client.post(
+                    reverse("orderline-bulk-create"),
+                    {
+                        "order": self.order.pk,
+                        "student": [self.student.pk] * len(products),
+                        "product": [product.pk for product in products],
+                        "quantity": [2] * len(products),
+                    },
+                )
+            self.assertEqual(response["HX-Trigger"], "orderlineCreated")
+
+    def test_orderline_delete(self):
+        line = self.order.orderlines.first()
+        line.quantity = 2
+        line.save()
+        # Primero resta una unidad y después borra la línea.
+        for budget in [14, 17]:
+            with self.assertNumQueries(budget):
+                response = self.client.post(
+                    reverse("orderline-delete"), {"orderline": line.pk}
+                )
+            self.assertEqual(response["HX-Trigger"], "orderlineRemoved")
+        self.assertFalse(OrderLine.objects.filter(pk=line.pk).exists())
+
+    def test_orderline_delete_closed_order(self):
+        line = self.order.orderlines.first()
+        Order.objects.filter(pk=self.order.pk).update(closed=True)
+        response = self.client.post(reverse("orderline-delete"), {"orderline": line.pk})
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(OrderLine.objects.filter(pk=line.pk).exists())
+
+
+class PerformanceTests(EventDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        performance_stats.reset()
+        self.addCleanup(performance_stats.reset)
+        self.url = reverse("staff-event", args=[self.event.pk])
+        self.client.force_login(self.staff)
+
+    def test_stats_are_bounded(self):
+        stats = PerformanceStats(ring_size=3, slow_queries=2)
+        for i in range(5):
+            stats.record(
+                "vista",
+                f"/{i}/",
+                7,
+                [("SELECT a", 1), ("SELECT a", 3), (f"SELECT {i}", i)],
+            )
+        stats.record("vista", "/", 30)
+        snapshot = stats.snapshot()
+        self.assertEqual([r["path"] for r in snapshot["recent"]], ["/2/", "/3/", "/4/"])
+        self.assertEqual(snapshot["recent"][0]["duplicates"], 1)
+        self.assertEqual(snapshot["recent"][0]["most_repeated"], "SELECT a")
+        view = snapshot["views"]["vista"]
+        self.assertEqual((view["requests"], view["sampled"]), (6, 5))
+        self.assertEqual((view["avg_queries"], view["avg_duplicates"]), (3, 1))
+        self.assertEqual(view["histogram"]["<=10"], 5)
+        self.assertEqual(view["histogram"]["<=50"], 1)
+        self.assertEqual([q["ms"] for q in view["slowest_sql"]], [4, 3])
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        response = self.client.get(self.url)
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^app;dur=[\d.]+;desc="staff-event", db;dur=[\d.]+;desc="\d+ queries"$',
+        )
+        view = performance_stats.snapshot()["views"]["staff-event"]
+        self.assertEqual(view["sampled"], 1)
+        self.assertGreater(view["avg_queries"], 0)
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_unsampled_request(self):
+        response = self.client.get(self.url)
+        self.assertNotIn("db;", response["Server-Timing"])
+        view = performance_stats.snapshot()["views"]["staff-event"]
+        self.assertEqual((view["requests"], view["sampled"]), (1, 0))
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=1)
+    async def test_asgi_request(self):
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(self.url)
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+    def test_performance_endpoint_is_staff_only(self):
+        url = reverse("staff-performance")
+        self.client.get(self.url)
+        self.assertIn("staff-event", self.client.get(url).json()["views"])
+        self.client.force_login(get_user_model().objects.create_user("representante"))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+class StockReservationTests(TransactionTestCase):
+    threads = 20
+    stock = 5
+
+    def setUp(self):
+        event = Event.objects.create(name="Evento", scheduled_for=datetime.date.today())
+        representative = Representative.objects.create(
+            id=584120000000, phone_code="58", phone_number="4120000000"
+        )
+        self.student = Student.objects.create(
+            name="Estudiante",
+            grade="1er. grado",
+            section="A",
+            representative=representative,
+        )
+        self.product = Product.objects.create(
+            name="Pan", price=1.5, stock=self.stock, event=event
+        )
+        self.order = Order.objects.create(representative=representative, event=event)
+
+    def buy_concurrently(self):
+        created = []
+
+        def buy():
+            try:
+                OrderLine.objects.create(
+                    order=self.order, student=self.student, product=self.product
+                )
+                created.append(1)
+            except Exception:
+                # OutOfStock, o bloqueos de la base de datos en SQLite.
+                pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.product.refresh_from_db()
+        return len(created)
+
+    def test_concurrent_purchases_never_oversell(self):
+        created = self.buy_concurrently()
+        self.assertGreaterEqual(self.product.stock, 0)
+        self.assertLessEqual(OrderLine.objects.count(), self.stock)
+        self.assertEqual(OrderLine.objects.count(), created)
+        self.assertEqual(self.product.stock + created, self.stock)
+
+    @skipUnless(connection.vendor == "postgresql", "Requiere bloqueo por fila.")
+    def test_concurrent_purchases_sell_out_exactly(self):
+        self.assertEqual(self.buy_concurrently(), self.stock)
+        self.assertEqual(self.product.stock, 0)
+
+    def test_concurrent_removals_release_line_quantity(self):
+        line = OrderLine.objects.create(
+            order=self.order, student=self.student, product=self.product, quantity=2
+        )
+
+        def remove():
+            try:
+                Client().post(reverse("orderline-delete"), {"orderline": line.pk})
+            except Exception:
+                pass
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=remove) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.product.refresh_from_db()
+        # En SQLite algunas peticiones pueden fallar por bloqueo; aun así, lo
+        # liberado nunca supera lo que tenía la línea.
+        remaining = sum(
+            OrderLine.objects.filter(pk=line.pk).values_list("quantity", flat=True)
+        )
+        self.assertEqual(self.product.stock + remaining, self.stock)
+
+    def test_deleting_twice_releases_once(self):
+        line = OrderLine.objects.create(
+            order=self.order, student=self.student, product=self.product
+        )
+        stale = OrderLine.objects.get(pk=line.pk)
+        self.assertEqual(line.delete()[0], 1)
+        self.assertEqual(stale.delete(), (0, {}))
+        self.assertEqual(OrderLine.objects.filter(pk=line.pk).delete(), (0, {}))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, self.stock)
+
+    def test_queryset_delete_releases_deleted_quantities(self):
+        OrderLine.objects.create(
+            order=self.order, student=self.student, product=self.product, quantity=2
+        )
+        lines = OrderLine.objects.filter(order=self.order)
+        self.assertEqual(lines.delete()[0], 1)
+        self.assertEqual(lines.delete(), (0, {}))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, self.stock)
+
+    def test_out_of_stock_reserves_nothing(self):
+        OrderLine.objects.bulk_create(
+            [
+                OrderLine(order=self.order, student=self.student, product=self.product)
+                for _ in range(self.stock - 1)
+            ]
+        )
+        with self.assertRaises(OutOfStock):
+            OrderLine.objects.bulk_create(
+                [
+                    OrderLine(
+                        order=self.order, student=self.student, product=self.product
+                    )
+                    for _ in range(2)
+                ]
+            )
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
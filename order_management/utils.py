@@ -1,9 +1,49 @@
+import csv
+import io
+import itertools
+import re
+import tempfile
+import xlsxwriter
+import zipfile
+from collections import defaultdict
+from datetime import timedelta
+from xml.etree import ElementTree
+from xml.etree.ElementTree import iterparse
+from functools import lru_cache
 from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
+from .models import Notification, Order, Representative, Student
+
+
+class FakeTwilioClient:
+    """Transporte en memoria para probar los envíos sin conexión."""
+
+    def __init__(self):
+        self.messages = self
+        self.sent = []
+
+    def create(self, to, from_, body):
+        self.sent.append({"to": to, "from_": from_, "body": body})
+        return type("Message", (), {"sid": f"FAKE{len(self.sent)}"})()
+
+
+@lru_cache(maxsize=None)
+def get_twilio_client():
+    if settings.TWILIO_FAKE:
+        return FakeTwilioClient()
+    return Client(
+        settings.TWILIO_ACCOUNT_SID,
+        settings.TWILIO_AUTH_TOKEN,
+        http_client=TwilioHttpClient(pool_connections=True, timeout=10),
+    )
 
 
 def send_whatsapp_message(to_number, body_text):
-    client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+    client = get_twilio_client()
 
     if not to_number.startswith("whatsapp:"):
         to_number = "whatsapp:" + to_number
@@ -12,3 +52,371 @@ def send_whatsapp_message(to_number, body_text):
         to=to_number, from_=settings.TWILIO_WHATSAPP_NUMBER, body=body_text
     )
     return message.sid
+
+
+def queue_notification(body_text, recipients=None):
+    if recipients is None:
+        recipients = settings.ORDER_NOTIFICATION_RECIPIENTS
+    Notification.objects.bulk_create(
+        [Notification(to_number=to_number, body=body_text) for to_number in recipients]
+    )
+
+
+def _digests(notifications):
+    # WhatsApp corta los mensajes a 1600 caracteres.
+    digest, length = [], 0
+    for notification in notifications:
+        if digest and length + len(notification.body) + 2 > 1600:
+            yield digest
+            digest, length = [], 0
+        digest.append(notification)
+        length += len(notification.body) + 2
+    if digest:
+        yield digest
+
+
+def send_pending_notifications(limit=500):
+    with transaction.atomic():
+        pending = list(
+            Notification.objects.select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True, next_attempt_at__lte=timezone.now())
+            .filter(attempts__lt=settings.NOTIFICATION_MAX_ATTEMPTS)
+            .order_by("to_number", "pk")[:limit]
+        )
+        # Se apartan por un minuto para que otro worker no las envíe también.
+        Notification.objects.filter(pk__in=[n.pk for n in pending]).update(
+            next_attempt_at=timezone.now() + timedelta(minutes=1)
+        )
+
+    sent = 0
+    for to_number, notifications in itertools.groupby(
+        pending, key=lambda notification: notification.to_number
+    ):
+        for digest in _digests(notifications):
+            now = timezone.now()
+            try:
+                send_whatsapp_message(to_number, "\n\n".join(n.body for n in digest))
+            except Exception as e:
+                for notification in digest:
+                    notification.attempts += 1
+                    notification.error = str(e)
+                    notification.next_attempt_at = now + timedelta(
+                        seconds=settings.NOTIFICATION_RETRY_DELAY
+                        * 2 ** (notification.attempts - 1)
+                    )
+            else:
+                sent += len(digest)
+                for notification in digest:
+                    notification.attempts += 1
+                    notification.error = ""
+                    notification.sent_at = now
+
+    Notification.objects.bulk_update(
+        pending, ["attempts", "error", "sent_at", "next_attempt_at"]
+    )
+    return sent
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_response(filename, columns, rows, file_format=None):
+    """
+    Exporta las filas sin cargarlas en memoria: en CSV se envían a medida que
+    se leen y en Excel se escriben fila a fila a un archivo temporal.
+    """
+    if file_format == "csv":
+        writer = csv.writer(_Echo())
+        response = StreamingHttpResponse(
+            itertools.chain(
+                ["\ufeff"],
+                (writer.writerow(row) for row in itertools.chain([columns], rows)),
+            ),
+            content_type="text/csv; charset=utf-8",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+        return response
+
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Sheet1")
+    bold = workbook.add_format({"bold": True})
+    worksheet.write_row(0, 0, columns, bold)
+    for index, row in enumerate(rows, start=1):
+        worksheet.write_row(index, 0, row)
+    workbook.close()
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f"{filename}.xlsx",
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
+_XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_XLSX_RELATIONSHIP = (
+    "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+)
+_XLSX_RELATIONSHIPS_NS = (
+    "{http://schemas.openxmlformats.org/package/2006/relationships}"
+)
+
+
+class InvalidSpreadsheet(ValueError):
+    pass
+
+
+def _xlsx_column(reference):
+    index = 0
+    for letter in reference.rstrip("0123456789"):
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def _xlsx_first_sheet(workbook):
+    # La primera hoja según xl/workbook.xml; su archivo no siempre es sheet1.xml.
+    sheet = ElementTree.fromstring(workbook.read("xl/workbook.xml")).find(
+        f"{_XLSX_NS}sheets/{_XLSX_NS}sheet"
+    )
+    relationships = ElementTree.fromstring(workbook.read("xl/_rels/workbook.xml.rels"))
+    for relationship in relationships.iter(f"{_XLSX_RELATIONSHIPS_NS}Relationship"):
+        if relationship.get("Id") == sheet.get(_XLSX_RELATIONSHIP):
+            target = relationship.get("Target")
+            return target[1:] if target.startswith("/") else f"xl/{target}"
+    raise KeyError("workbook.xml.rels")
+
+
+def _iter_xlsx_rows(file):
+    try:
+        yield from _read_xlsx_rows(file)
+    except (
+        AttributeError,
+        IndexError,
+        KeyError,
+        ElementTree.ParseError,
+        zipfile.BadZipFile,
+    ) as e:
+        raise InvalidSpreadsheet(f"Archivo XLSX no válido: {e}") from e
+
+
+def _read_xlsx_rows(file):
+    with zipfile.ZipFile(file) as workbook:
+        shared = []
+        if "xl/sharedStrings.xml" in workbook.namelist():
+            with workbook.open("xl/sharedStrings.xml") as strings:
+                for _, element in iterparse(strings):
+                    if element.tag == f"{_XLSX_NS}si":
+                        shared.append(
+                            "".join(
+                                text.text or "" for text in element.iter(f"{_XLSX_NS}t")
+                            )
+                        )
+                        element.clear()
+
+        with workbook.open(_xlsx_first_sheet(workbook)) as sheet:
+            for _, element in iterparse(sheet):
+                if element.tag != f"{_XLSX_NS}row":
+                    continue
+                row = []
+                for cell in element.iter(f"{_XLSX_NS}c"):
+                    if cell.get("t") == "inlineStr":
+                        value = "".join(
+                            text.text or "" for text in cell.iter(f"{_XLSX_NS}t")
+                        )
+                    else:
+                        value = cell.findtext(f"{_XLSX_NS}v") or ""
+                        if cell.get("t") == "s" and value:
+                            value = shared[int(value)]
+                    column = (
+                        _xlsx_column(cell.get("r", "")) if cell.get("r") else len(row)
+                    )
+                    row.extend([""] * (column - len(row)))
+                    row.append(value)
+                yield row
+                element.clear()
+
+
+def read_spreadsheet(file):
+    """
+    Lee una hoja de cálculo (CSV o XLSX) fila a fila, sin cargarla completa.
+    De un XLSX solo se lee la primera hoja; si está dañado se lanza
+    InvalidSpreadsheet.
+    """
+    if zipfile.is_zipfile(file):
+        file.seek(0)
+        yield from _iter_xlsx_rows(file)
+    else:
+        file.seek(0)
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", errors="replace")
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(text, dialect)
+
+
+def _parse_amount(value):
+    value = re.sub(r"[^\d,.\-]", "", str(value))
+    if "," in value and "." in value:
+        if value.rindex(",") > value.rindex("."):
+            value = value.replace(".", "").replace(",", ".")
+        else:
+            value = value.replace(",", "")
+    else:
+        value = value.replace(",", ".")
+    return round(float(value), 2)
+
+
+def reconcile_payments(event_id, rows, user=None):
+    """
+    Cruza las filas de un estado de cuenta con los pedidos de Pago móvil del
+    evento por número de referencia y monto en Bs. Los pedidos que coinciden
+    se marcan como confirmados con Order.update_status.
+    """
+    rows = iter(rows)
+    header = [str(column).strip().lower() for column in next(rows, [])]
+    reference_column = next(
+        (i for i, column in enumerate(header) if "ref" in column), 0
+    )
+    amount_column = next(
+        (
+            i
+            for i, column in enumerate(header)
+            if "monto" in column or "amount" in column
+        ),
+        1,
+    )
+
+    orders = defaultdict(list)
+    for pk, reference_number, amount_bs in Order.objects.filter(
+        event_id=event_id,
+        closed=True,
+        rejected=False,
+        payment_method=0,
+        reference_number__isnull=False,
+    ).values_list("pk", "reference_number", "amount_bs"):
+        orders[reference_number].append((pk, round(amount_bs or 0, 2)))
+
+    matched = set()
+    unmatched = []
+    for line, row in enumerate(rows, start=2):
+        try:
+            reference = int(re.sub(r"\D", "", str(row[reference_column])))
+            amount = _parse_amount(row[amount_column])
+        except (IndexError, ValueError):
+            unmatched.append((line, "", "", "Fila no válida"))
+            continue
+
+        candidates = orders.get(reference, [])
+        hits = [
+            pk for pk, order_amount in candidates if abs(order_amount - amount) < 0.01
+        ]
+        if len(hits) == 1:
+            matched.add(hits[0])
+        elif hits:
+            unmatched.append((line, reference, amount, "Referencia ambigua"))
+        elif candidates:
+            unmatched.append((line, reference, amount, "Monto no coincide"))
+        else:
+            unmatched.append((line, reference, amount, "Sin coincidencia"))
+
+    checked = Order.objects.filter(pk__in=matched).update_status(0, user)
+    return len(matched), len(checked), unmatched
+
+
+def normalize_phone(phone, phone_code="58"):
+    """
+    Devuelve (código, número) a partir de un teléfono escrito en cualquier
+    formato habitual: +58 412-1234567, 0412 1234567, 584121234567...
+    """
+    digits = re.sub(r"\D", "", str(phone)).removeprefix("00")
+    if len(digits) > 10 and digits.startswith(phone_code):
+        digits = digits[len(phone_code) :]
+    digits = digits.removeprefix("0")
+    if len(digits) != 10:
+        raise ValueError(f"Teléfono no válido: {phone}")
+    return phone_code, digits
+
+
+def _import_roster_chunk(representatives, students):
+    Representative.objects.bulk_create(
+        [r for r in representatives.values() if r.first_name],
+        update_conflicts=True,
+        unique_fields=["id"],
+        update_fields=["first_name", "phone_code", "phone_number"],
+    )
+    # Sin nombre en el archivo se conserva el que ya tenía el representante.
+    Representative.objects.bulk_create(
+        [r for r in representatives.values() if not r.first_name],
+        ignore_conflicts=True,
+    )
+    Student.objects.bulk_create(
+        students.values(),
+        update_conflicts=True,
+        unique_fields=["representative", "name"],
+        update_fields=["grade", "section"],
+    )
+
+
+def import_roster(rows, chunk_size=1000):
+    """
+    Carga representantes y estudiantes desde filas con las columnas teléfono,
+    representante, estudiante, grado y sección. Las filas existentes se
+    actualizan; las filas con errores se omiten y se reportan.
+    """
+    grades = {value.lower(): value for value, _ in Student.GRADE_CHOICES}
+    sections = {value for value, _ in Student.SECTION_CHOICES}
+
+    representatives = {}
+    students = {}
+    imported = 0
+    errors = []
+    rows = iter(rows)
+    next(rows, None)
+    for line, row in enumerate(rows, start=2):
+        row = [str(value).strip() for value in row] + [""] * (5 - len(row))
+        phone, first_name, name, grade, section = row[:5]
+        if not any(row):
+            continue
+        try:
+            phone_code, phone_number = normalize_phone(phone)
+        except ValueError as error:
+            errors.append((line, str(error)))
+            continue
+        if not name:
+            errors.append((line, "Falta el nombre del estudiante"))
+            continue
+        if grade.lower() not in grades:
+            errors.append((line, f"Grado no válido: {grade}"))
+            continue
+        if section.upper() not in sections:
+            errors.append((line, f"Sección no válida: {section}"))
+            continue
+
+        representative = int(f"{phone_code}{phone_number}")
+        previous = representatives.get(representative)
+        representatives[representative] = Representative(
+            id=representative,
+            first_name=first_name or (previous and previous.first_name) or None,
+            phone_code=phone_code,
+            phone_number=phone_number,
+        )
+        students[representative, name] = Student(
+            representative_id=representative,
+            name=name,
+            grade=grades[grade.lower()],
+            section=section.upper(),
+        )
+        imported += 1
+        if len(students) >= chunk_size:
+            _import_roster_chunk(representatives, students)
+            representatives, students = {}, {}
+
+    if students:
+        _import_roster_chunk(representatives, students)
+    return imported, errors
@@ -1,15 +1,39 @@
-import pandas as pd
-import io
-from django.shortcuts import render, redirect
-from django.http import HttpResponse
+import asyncio
+import json
+from collections import Counter
+from itertools import zip_longest
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.shortcuts import get_object_or_404, render, redirect
+from django.views.decorators.http import require_POST
+from django.http import (
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.views.generic import (
     TemplateView,
     ListView,
+    DetailView,
     CreateView,
     UpdateView,
     DeleteView,
 )
-from django.db.models import Sum, Case, When, Value, CharField, Count
+from django.db import transaction
+from django.db.models import (
+    Case,
+    When,
+    Value,
+    CharField,
+    Exists,
+    F,
+    OuterRef,
+    Q,
+    Sum,
+)
+from django.db.models.functions import Coalesce
 from django.contrib import messages
 from .models import (
     Student,
@@ -17,10 +41,25 @@ from .models import (
     Product,
     Order,
     OrderLine,
-    ExchangeRate,
     Event,
+    ExchangeRate,
+    OutOfStock,
+    cache_version,
+    release_stock,
+    order_total,
+    track_product_stats,
+)
+from .middleware import performance_stats
+from .events import event_channel, get_broker, publish_event
+from .utils import (
+    InvalidSpreadsheet,
+    queue_notification,
+    export_response,
+    read_spreadsheet,
+    import_roster,
+    normalize_phone,
+    reconcile_payments,
 )
-from .utils import send_whatsapp_message
 
 
 class WelcomeView(TemplateView):
@@ -45,17 +84,142 @@ class RepresentativeCreateView(CreateView):
     template_name = "order_management/representative/create.html"
     fields = ["phone_code", "phone_number", "first_name"]
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        self.phone_error = None
+        if "data" in kwargs:
+            data = kwargs["data"].copy()
+            try:
+                data["phone_code"], data["phone_number"] = normalize_phone(
+                    data.get("phone_number", ""), data.get("phone_code") or "58"
+                )
+            except ValueError as error:
+                self.phone_error = str(error)
+            kwargs["data"] = data
+        return kwargs
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        if self.phone_error:
+            form.errors.pop("phone_number", None)
+            form.add_error("phone_number", self.phone_error)
+        return form
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["event"] = self.request.POST.get("event")
+        return context
+
     def form_valid(self, form):
-        representative = form.save(commit=False)
-        representative.id = int(
-            f"{representative.phone_code}{representative.phone_number}"
+        phone_code = form.cleaned_data["phone_code"]
+        phone_number = form.cleaned_data["phone_number"]
+        representative = int(f"{phone_code}{phone_number}")
+        if form.cleaned_data["first_name"]:
+            # Un solo INSERT ... ON CONFLICT DO NOTHING: un representante que
+            # vuelve conserva su nombre y dos envíos simultáneos no chocan.
+            Representative.objects.bulk_create(
+                [
+                    Representative(
+                        id=representative,
+                        first_name=form.cleaned_data["first_name"],
+                        phone_code=phone_code,
+                        phone_number=phone_number,
+                    )
+                ],
+                ignore_conflicts=True,
+            )
+        elif not Representative.objects.filter(pk=representative).exists():
+            return self.render_to_response(
+                self.get_context_data(form=form, needs_name=True)
+            )
+
+        # El listado de estudiantes y el carrito van en la misma respuesta en
+        # lugar de cargarse con peticiones adicionales.
+        return render(
+            self.request,
+            "order_management/cart.html",
+            context=cart_context(
+                self.request, representative, self.request.POST.get("event")
+            ),
         )
-        representative.save()
-        context = {}
-        context["representative"] = representative.id
-        context["event"] = self.request.POST.get("event")
 
-        return render(self.request, "order_management/order_view.html", context=context)
+
+def cart_session_key(representative, event):
+    return f"cart:{event}:{representative}"
+
+
+def get_cart_id(request, representative, event):
+    key = cart_session_key(representative, event)
+    if key not in request.session:
+        request.session[key] = Order.objects.get_open(representative, event).pk
+    return request.session[key]
+
+
+def cart_context(request, representative, event, student=None):
+    """
+    Resuelve de una sola vez todo lo que muestra la página de pedido:
+    estudiantes, carrito abierto con sus líneas, catálogo y pedidos realizados.
+    """
+    event = Event.objects.get(pk=event)
+    # Una lectura simple por el id guardado en sesión; get_open (que escribe)
+    # solo si esa orden ya se cerró o no existe.
+    order = Order.objects.filter(
+        pk=get_cart_id(request, representative, event.pk),
+        representative_id=representative,
+        event=event,
+        closed=False,
+    ).first()
+    if order is None:
+        order = Order.objects.get_open(representative, event.pk)
+        request.session[cart_session_key(representative, event.pk)] = order.pk
+
+    students = list(Student.objects.filter(representative_id=representative))
+    selected = next(
+        (s for s in students if str(s.pk) == str(student)),
+        students[0] if students else None,
+    )
+    orderlines = list(
+        order.orderlines.select_related("student", "product").order_by(
+            "student_id", "pk"
+        )
+    )
+    return {
+        "representative": representative,
+        "event": event,
+        "order": order,
+        "order_id": order.pk,
+        "student_list": students,
+        "student": selected,
+        "orderlines": orderlines,
+        "total": sum(orderline.subtotal for orderline in orderlines),
+        "product_list": Product.objects.filter(event=event, hidden=False),
+        "catalogue_version": cache_version(f"catalogue:{event.pk}"),
+        "grades": Student.GRADE_CHOICES,
+        "sections": Student.SECTION_CHOICES,
+        "order_list": Order.objects.filter(
+            representative_id=representative, event=event, closed=True
+        )
+        .with_total()
+        .with_lines(),
+    }
+
+
+class CartView(TemplateView):
+    template_name = "order_management/cart.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(
+            cart_context(
+                self.request,
+                self.request.GET.get("representative"),
+                self.request.GET.get("event"),
+                self.request.GET.get("student"),
+            )
+        )
+        # Las actualizaciones reemplazan cada fragmento por su id.
+        context["oob"] = True
+        return context
 
 
 class StudentListView(ListView):
@@ -64,15 +228,13 @@ class StudentListView(ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        representative = self.request.GET.get("representative")
-        context["representative"] = representative
-        event = self.request.GET.get("event")
-        context["event"] = event
-
-        order = Order.objects.get_or_create(
-            representative_id=representative, closed=False, event_id=event
-        )[0]
-        context["order"] = order
+        context.update(
+            cart_context(
+                self.request,
+                self.request.GET.get("representative"),
+                self.request.GET.get("event"),
+            )
+        )
         return context
 
     def get_queryset(self):
@@ -111,22 +273,15 @@ class OrderStudentView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        event = Event.objects.get(pk=self.request.GET.get("event"))
-        try:
-            student = Student.objects.get(pk=self.request.GET.get("student"))
-            order = Order.objects.get_or_create(
-                representative=student.representative, closed=False, event=event
-            )[0]
-            context["student"] = student
-            context["order"] = order
-
-            context["exchange_rate"] = (
-                ExchangeRate.objects.all().order_by("-created_at").first()
+        student = get_object_or_404(Student, pk=self.request.GET.get("student"))
+        context.update(
+            cart_context(
+                self.request,
+                student.representative_id,
+                self.request.GET.get("event"),
+                student.pk,
             )
-        except:
-            pass
-
-        context["event"] = event
+        )
         return context
 
 
@@ -143,7 +298,8 @@ class OrderListView(ListView):
                 event_id=self.request.GET.get("event"),
                 closed=True,
             )
-            .annotate(total=Sum("orderlines__product__price"))
+            .with_total()
+            .with_lines()
         )
 
 
@@ -155,13 +311,16 @@ class ProductListView(ListView):
         context = super().get_context_data(**kwargs)
         context["order"] = self.request.GET.get("order")
         context["student"] = self.request.GET.get("student")
-        context["exchange_rate"] = (
-            ExchangeRate.objects.all().order_by("-created_at").first()
-        )
+        context["event"] = self.request.GET.get("event")
+        context["catalogue_version"] = cache_version(f"catalogue:{context["event"]}")
         return context
 
     def get_queryset(self):
-        return super().get_queryset().filter(event_id=self.request.GET.get("event"))
+        return (
+            super()
+            .get_queryset()
+            .filter(event_id=self.request.GET.get("event"), hidden=False)
+        )
 
 
 class OrderLineCreateView(CreateView):
@@ -169,9 +328,23 @@ class OrderLineCreateView(CreateView):
     template_name = "order_management/orderline/create.html"
     fields = ["student", "order", "product"]
 
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        form.fields["order"].queryset = Order.objects.filter(closed=False)
+        form.fields["product"].queryset = Product.objects.filter(hidden=False)
+        return form
+
     def form_valid(self, form):
-        form.save()
-        response = HttpResponse(status=204)
+        order = form.cleaned_data["order"]
+        student = form.cleaned_data["student"]
+        product = form.cleaned_data["product"]
+        try:
+            OrderLine.objects.add_items(order, {(student.pk, product.pk): 1})
+        except OutOfStock:
+            response = cart_update_response(self.request, order, student, [product.pk])
+            response["HX-Trigger"] = "productSoldOut"
+            return response
+        response = cart_update_response(self.request, order, student, [product.pk])
         response["HX-Trigger"] = "orderlineCreated"
         return response
 
@@ -191,21 +364,156 @@ class StaffEventView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["grades"] = Student.GRADE_CHOICES
+        context["payment_methods"] = Order.PAYMENT_METHOD_CHOICES
+        context["statuses"] = Order.STATUS_CHOICES
         context["event"] = Event.objects.get(pk=kwargs["event"])
+        context["event_stream"] = isinstance(self.request, ASGIRequest)
+        return context
+
+
+def preparation_report(event, grade=None):
+    grades = [grade for grade, _ in Student.GRADE_CHOICES]
+    key = f"preparation:{event}:{cache_version(f"preparation:{event}")}"
+    rows = cache.get(key)
+    if rows is None:
+        rows = sorted(
+            OrderLine.objects.filter(order__event_id=event, order__closed=True)
+            .exclude(order__rejected=True)
+            .order_by()
+            .values_list("student__grade", "student__section", "product__name")
+            .annotate(units=Sum("quantity")),
+            key=lambda row: (grades.index(row[0]), row[1], row[2]),
+        )
+        cache.set(key, rows, 3600)
+    if grade:
+        rows = [row for row in rows if row[0] == grade]
+    return rows
+
+
+class StaffPreparationView(TemplateView):
+    template_name = "order_management/staff/preparation/list.html"
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get("format"):
+            return export_response(
+                "preparacion",
+                ["Grado", "Sección", "Producto", "Cantidad"],
+                preparation_report(kwargs["event"], request.GET.get("grade")),
+                request.GET["format"],
+            )
+        if request.GET.get("print"):
+            self.template_name = "order_management/staff/preparation/print.html"
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["grade"] = self.request.GET.get("grade", "")
+        context["rows"] = [
+            {"grade": grade, "section": section, "product": product, "units": units}
+            for grade, section, product, units in preparation_report(
+                kwargs["event"], context["grade"]
+            )
+        ]
         return context
 
 
 class StaffOderList(ListView):
     model = Order
     template_name = "order_management/staff/order/list.html"
+    page_size = 25
 
     def get_queryset(self):
-        queryset = (
-            Order.objects.filter(closed=True, event_id=self.request.GET.get("event"))
-            .annotate(total=Sum("orderlines__product__price"))
-            .order_by("-pk")
+        queryset = Order.objects.filter(
+            closed=True, event_id=self.request.GET.get("event")
         )
-        return queryset
+
+        status = self.request.GET.get("status")
+        if status == "checked":
+            queryset = queryset.filter(checked=True)
+        elif status == "rejected":
+            queryset = queryset.filter(rejected=True)
+        elif status == "pending":
+            queryset = queryset.filter(checked=False, rejected=False)
+
+        payment_method = self.request.GET.get("payment_method", "")
+        if payment_method.isdigit():
+            queryset = queryset.filter(payment_method=payment_method)
+
+        search = self.request.GET.get("q", "").strip()
+        if search.isdigit():
+            lookup = Q(reference_number=search)
+            try:
+                phone_code, phone_number = normalize_phone(search)
+            except ValueError:
+                pass
+            else:
+                lookup |= Q(representative_id=int(f"{phone_code}{phone_number}"))
+            queryset = queryset.filter(lookup)
+        elif search:
+            queryset = queryset.filter(
+                Exists(
+                    OrderLine.objects.filter(
+                        order=OuterRef("pk"), student__name__icontains=search
+                    )
+                )
+            )
+
+        # Paginación por clave: el índice (event, closed, -id) evita el OFFSET.
+        before = self.request.GET.get("before", "")
+        if before.isdigit():
+            queryset = queryset.filter(pk__lt=before)
+
+        return queryset.with_total().with_lines().order_by("-pk")[: self.page_size + 1]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        orders = list(context["order_list"])
+        context["order_list"] = orders[: self.page_size]
+        context["has_more"] = len(orders) > self.page_size
+        if context["has_more"]:
+            context["last_pk"] = orders[self.page_size - 1].pk
+        return context
+
+
+class StaffOrderDetailView(DetailView):
+    model = Order
+    template_name = "order_management/staff/order/card.html"
+    context_object_name = "order"
+
+    def get_queryset(self):
+        return Order.objects.filter(closed=True).with_total().with_lines()
+
+
+async def staff_event_stream(request, event):
+    user = await request.auser()
+    if not user.is_staff:
+        return HttpResponseForbidden()
+    if not isinstance(request, ASGIRequest):
+        # Bajo WSGI la respuesta se acumularía entera y ocuparía un worker
+        # para siempre; 204 le indica a EventSource que no reconecte.
+        return HttpResponse(status=204)
+
+    async def stream():
+        async with get_broker().subscribe(event_channel(event)) as messages:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    name, data = await asyncio.wait_for(messages.get(), 15)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                else:
+                    yield f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def staff_performance(request):
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    return JsonResponse(performance_stats.snapshot())
 
 
 class StaffProductListView(ListView):
@@ -217,7 +525,10 @@ class StaffProductListView(ListView):
             super()
             .get_queryset()
             .filter(event=self.kwargs.get("event"), hidden=False)
-            .annotate(sold=Count("orderlines"))
+            .annotate(
+                sold=Coalesce(Sum("stats__sold"), 0),
+                revenue=Coalesce(Sum("stats__revenue"), 0.0),
+            )
         )
 
 
@@ -265,27 +576,27 @@ class StaffProductHideView(UpdateView):
 def order_close(request, pk):
 
     if request.method == "POST":
-        order = Order.objects.get(pk=pk)
+        order = Order.objects.with_total().get(pk=pk)
         order.reference_number = (
             request.POST.get("reference_number")
             if request.POST.get("reference_number") != ""
             else None
         )
         order.payment_method = request.POST.get("payment_method")
-        order.exchange_rate = ExchangeRate.objects.get(
-            pk=request.POST.get("exchange_rate")
+        order.exchange_rate = get_object_or_404(
+            ExchangeRate, pk=request.POST.get("exchange_rate")
         )
+        order.amount_bs = (order.total or 0) * order.exchange_rate.rate
         order.closed = True
         order.save()
+        request.session.pop(
+            cart_session_key(order.representative_id, order.event_id), None
+        )
 
         message = f"+{order.representative.phone_code} {order.representative.phone_number}: {order.representative.first_name} ha realizado una nueva orden, nro. de referencia #{order.reference_number}. Por favor confirmar pago."
 
-        try:
-            send_whatsapp_message("+584123517748", message)
-            send_whatsapp_message("+584248377782", message)
-            send_whatsapp_message("+584121665210", message)
-        except:
-            print("Twilio error")
+        queue_notification(message)
+        publish_event(order.event_id, "order-closed", order=order.pk)
 
         messages.success(request, "Pedido realizado con éxito")
 
@@ -293,18 +604,10 @@ def order_close(request, pk):
 
     elif request.method == "GET":
         context = {}
-        order = Order.objects.get(pk=pk)
+        order = Order.objects.with_total().get(pk=pk)
         context["order"] = order
 
-        context["exchange_rate"] = (
-            ExchangeRate.objects.all().order_by("-created_at").first()
-        )
-
-        context["total"] = (
-            order.orderlines.all().aggregate(total=Sum("product__price"))["total"]
-            if order.orderlines.all()
-            else 0
-        )
+        context["total"] = order.total or 0
 
         return render(
             request, "order_management/order/order_close.html", context=context
@@ -314,32 +617,158 @@ def order_close(request, pk):
 def order_update_status(request, pk):
     if request.method == "GET":
         if request.user.is_staff:
-            order = Order.objects.get(pk=pk)
-
-            status = request.GET["status"]
-            if status == "0":
-                order.rejected = False
-                order.checked = True
-            elif status == "1":
-                order.rejected = True
-                order.checked = False
-            elif status == "2":
-                order.checked = False
-                order.rejected = False
-
-            order.save()
-
-            response = HttpResponse(status=204)
+            try:
+                status = int(request.GET["status"])
+            except (KeyError, ValueError):
+                return HttpResponseBadRequest()
+            if status not in Order.STATUS_FIELDS:
+                return HttpResponseBadRequest()
+
+            for order, event in Order.objects.filter(pk=pk).update_status(
+                status, request.user
+            ):
+                publish_event(event, "status-changed", order=order)
+
+            response = render(
+                request,
+                "order_management/staff/order/card.html",
+                context={
+                    "order": get_object_or_404(
+                        Order.objects.with_total().with_lines(), pk=pk
+                    )
+                },
+            )
             response["HX-Trigger"] = "orderStatusUpdated"
             return response
+        return HttpResponseForbidden()
 
 
-def orderline_delete(request):
+@require_POST
+def order_bulk_update_status(request):
+    if request.user.is_staff:
+        try:
+            status = int(request.POST["status"])
+            orders = [int(order) for order in request.POST.getlist("order")]
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest()
+        if status not in Order.STATUS_FIELDS:
+            return HttpResponseBadRequest()
+
+        changed = Order.objects.filter(pk__in=orders).update_status(
+            status, request.user
+        )
+        for order, event in changed:
+            publish_event(event, "status-changed", order=order)
+
+        response = render(
+            request,
+            "order_management/staff/order/cards.html",
+            context={
+                "order_list": Order.objects.filter(
+                    pk__in=[order for order, _ in changed]
+                )
+                .with_total()
+                .with_lines()
+            },
+        )
+        response["HX-Trigger"] = "orderStatusUpdated"
+        return response
+    return HttpResponseForbidden()
+
+
+def cart_update_response(request, order, student, products):
+    """
+    Devuelve como fragmentos fuera de banda las líneas del carrito, el total y
+    la disponibilidad de los productos afectados, sin recargar la página.
+    """
+    orderlines = list(
+        OrderLine.objects.filter(order=order)
+        .select_related("student", "product")
+        .order_by("student_id", "pk")
+    )
+    return render(
+        request,
+        "order_management/order/cart_update.html",
+        context={
+            "order_id": order.pk,
+            "orderlines": orderlines,
+            "student": student,
+            "total": sum(orderline.subtotal for orderline in orderlines),
+            "product_list": Product.objects.filter(pk__in=products),
+        },
+    )
+
+
+def orderline_bulk_create(request):
     if request.method == "POST":
-        orderline = OrderLine.objects.get(pk=request.POST.get("orderline"))
-        orderline.delete()
+        order = get_object_or_404(Order, pk=request.POST.get("order"), closed=False)
+        try:
+            items = [
+                (int(student), int(product), int(quantity or 1))
+                for student, product, quantity in zip_longest(
+                    request.POST.getlist("student"),
+                    request.POST.getlist("product"),
+                    request.POST.getlist("quantity"),
+                )
+            ]
+        except (TypeError, ValueError):
+            return HttpResponseBadRequest()
+
+        students = Student.objects.filter(
+            pk__in=[student for student, _, _ in items],
+            representative_id=order.representative_id,
+        ).in_bulk()
+        products = set(
+            Product.objects.filter(
+                pk__in=[product for _, product, _ in items],
+                event_id=order.event_id,
+                hidden=False,
+            ).values_list("pk", flat=True)
+        )
+        if not items or any(
+            student not in students or product not in products or not 0 < quantity <= 50
+            for student, product, quantity in items
+        ):
+            return HttpResponseBadRequest()
+
+        quantities = Counter()
+        for student, product, quantity in items:
+            quantities[student, product] += quantity
+        student = students[items[0][0]]
+        try:
+            OrderLine.objects.add_items(order, quantities)
+        except OutOfStock:
+            response = cart_update_response(request, order, student, products)
+            response["HX-Trigger"] = "productSoldOut"
+            return response
+        response = cart_update_response(request, order, student, products)
+        response["HX-Trigger"] = "orderlineCreated"
+        return response
 
-        response = HttpResponse(status=204)
+
+def orderline_delete(request):
+    if request.method == "POST":
+        with transaction.atomic():
+            # La línea se bloquea antes de decidir entre restar y borrar, así
+            # dos clics seguidos no liberan más unidades de las que tenía.
+            orderline = get_object_or_404(
+                OrderLine.objects.select_related("order", "student").select_for_update(
+                    of=("self",)
+                ),
+                pk=request.POST.get("orderline"),
+                order__closed=False,
+            )
+            if orderline.quantity > 1:
+                lines = OrderLine.objects.filter(pk=orderline.pk)
+                with track_product_stats(lines):
+                    lines.update(quantity=F("quantity") - 1)
+                release_stock({orderline.product_id: 1})
+            else:
+                orderline.delete()
+
+        response = cart_update_response(
+            request, orderline.order, orderline.student, [orderline.product_id]
+        )
         response["HX-Trigger"] = "orderlineRemoved"
         return response
 
@@ -353,8 +782,7 @@ def student_remove(request, pk):
     elif request.method == "POST":
         student = Student.objects.get(pk=pk)
         student.representative = None
-        for orderline in OrderLine.objects.filter(student=student, order__closed=False):
-            orderline.delete()
+        OrderLine.objects.filter(student=student, order__closed=False).delete()
 
         student.save()
 
@@ -363,6 +791,62 @@ def student_remove(request, pk):
         return response
 
 
+def roster_import(request):
+    if request.method == "POST":
+        if request.user.is_staff:
+            roster = request.FILES.get("roster")
+            if roster is None:
+                return HttpResponseBadRequest()
+
+            try:
+                with transaction.atomic():
+                    imported, errors = import_roster(read_spreadsheet(roster.file))
+            except InvalidSpreadsheet:
+                return HttpResponseBadRequest()
+
+            return render(
+                request,
+                "order_management/staff/roster/report.html",
+                context={
+                    "imported": imported,
+                    "errors": errors[:200],
+                    "error_count": len(errors),
+                },
+            )
+        return HttpResponseForbidden()
+
+
+def order_reconcile(request, event):
+    if request.method == "POST":
+        if request.user.is_staff:
+            statement = request.FILES.get("statement")
+            if statement is None:
+                return HttpResponseBadRequest()
+
+            try:
+                matched, checked, unmatched = reconcile_payments(
+                    event, read_spreadsheet(statement.file), request.user
+                )
+            except InvalidSpreadsheet:
+                return HttpResponseBadRequest()
+            if checked:
+                publish_event(event, "orders-reconciled", checked=checked)
+
+            response = render(
+                request,
+                "order_management/staff/order/reconcile.html",
+                context={
+                    "matched": matched,
+                    "checked": checked,
+                    "unmatched": unmatched[:200],
+                    "unmatched_count": len(unmatched),
+                },
+            )
+            response["HX-Trigger"] = "ordersReconciled"
+            return response
+        return HttpResponseForbidden()
+
+
 def export_orders(request):
     grade_choices = Student.GRADE_CHOICES
     student_grade_display_case = Case(
@@ -394,12 +878,13 @@ def export_orders(request):
     else:
         orderlines = OrderLine.objects.filter(order__event=event, order__closed=True)
 
-    data = (
+    rows = (
         orderlines.exclude(order__rejected=True)
-        .annotate(total=Sum("order__orderlines__product__price"))
+        .annotate(total=order_total(OuterRef("order_id")))
         .annotate(student__grade_display=student_grade_display_case)
         .annotate(order__payment_method_display=order_payment_method_display_case)
-        .values(
+        .order_by("order__pk", "student__pk", "pk")
+        .values_list(
             "order__pk",
             "order__representative__first_name",
             "order__payment_method_display",
@@ -409,67 +894,49 @@ def export_orders(request):
             "student__grade_display",
             "student__section",
             "product__name",
-            "product__price",
+            "unit_price",
+            "quantity",
         )
+        .iterator(chunk_size=2000)
     )
 
-    df = pd.DataFrame(list(data))
-
-    if not df.empty:
-        df.columns = [
-            "ID",
-            "Nombre del representante",
-            "Método de pago",
-            "# de referencia",
-            "Total del pago",
-            "Nombre del estudiante",
-            "Grado",
-            "Sección",
-            "Producto",
-            "Precio del producto",
-        ]
+    columns = [
+        "ID",
+        "Nombre del representante",
+        "Método de pago",
+        "# de referencia",
+        "Total del pago",
+        "Nombre del estudiante",
+        "Grado",
+        "Sección",
+        "Producto",
+        "Precio del producto",
+        "Cantidad",
+    ]
 
-    output = io.BytesIO()
-
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, sheet_name="Sheet1", index=False)
-    output.seek(0)
-    excel_data = output.getvalue()
-    response = HttpResponse(
-        excel_data,
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
-    response["Content-Disposition"] = 'attachment; filename="pedidos.xlsx"'
-    return response
+    return export_response("pedidos", columns, rows, request.GET.get("format"))
 
 
 def export_products(request):
     event = request.GET.get("event", "")
-    data = (
+    rows = (
         Product.objects.filter(event_id=event, hidden=False)
-        .annotate(sold=Count("orderlines"))
-        .values("name", "price", "stock", "sold")
+        .annotate(
+            sold=Coalesce(Sum("stats__sold"), 0),
+            revenue=Coalesce(Sum("stats__revenue"), 0.0),
+            revenue_bs=Coalesce(Sum("stats__revenue_bs"), 0.0),
+        )
+        .values_list("name", "price", "stock", "sold", "revenue", "revenue_bs")
+        .iterator(chunk_size=2000)
     )
 
-    df = pd.DataFrame(list(data))
-
-    if not df.empty:
-        df.columns = [
-            "Nombre",
-            "Precio",
-            "Disponibles",
-            "Vendidos",
-        ]
+    columns = [
+        "Nombre",
+        "Precio",
+        "Disponibles",
+        "Vendidos",
+        "Ingresos ($)",
+        "Ingresos (Bs.)",
+    ]
 
-    output = io.BytesIO()
-
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, sheet_name="Sheet1", index=False)
-    output.seek(0)
-    excel_data = output.getvalue()
-    response = HttpResponse(
-        excel_data,
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
-    response["Content-Disposition"] = 'attachment; filename="productos.xlsx"'
-    return response
+    return export_response("productos", columns, rows, request.GET.get("format"))
@@ -20,6 +20,37 @@ const handleInputUpdatePaymentMethod = (element) => {
     }
 }
 
+const connectStaffEventStream = (element) => {
+    const orderUrl = (order) => element.dataset.orderUrl.replace(/0\/$/, `${order}/`)
+    const source = new EventSource(element.dataset.streamUrl)
+
+    const filtered = () => $('#staff-order-filter').serializeArray().some((field) => field.name != 'event' && field.value)
+
+    source.addEventListener('order-closed', (event) => {
+        const data = JSON.parse(event.data)
+        if (filtered()) {
+            htmx.trigger('#staff-order-filter', 'change')
+        } else if (!document.getElementById(`staff-order-${data.order}`)) {
+            htmx.ajax('GET', orderUrl(data.order), { target: '#staff-order-list', swap: 'afterbegin' })
+        }
+    })
+    source.addEventListener('status-changed', (event) => {
+        const data = JSON.parse(event.data)
+        if (document.getElementById(`staff-order-${data.order}`)) {
+            htmx.ajax('GET', orderUrl(data.order), { target: `#staff-order-${data.order}`, swap: 'outerHTML' })
+        }
+    })
+    source.addEventListener('orders-reconciled', () => {
+        htmx.trigger(document.body, 'ordersReconciled')
+    })
+    source.addEventListener('stock-changed', (event) => {
+        const data = JSON.parse(event.data)
+        $(`#staff-product-stock-${data.product}`).text(data.stock)
+    })
+}
+
+$('#staff-event-stream').each((index, element) => connectStaffEventStream(element))
+
 setTimeout(() => {
     $('#messages').fadeOut()
 }, 5000);   
\ No newline at end of file